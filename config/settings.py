@@ -23,11 +23,44 @@ class Settings:
     BASE_URL = os.getenv('BASE_URL', 'https://api.webmaster.yandex.net/v4')  # v4!
     USER_ID = os.getenv('USER_ID', '238948933')
     HOST_ID = os.getenv('HOST_ID', 'https:profi-filter.ru:443')
+    # TEXT_MATCH по URL совпадает и с более длинными URL - оставляем строку самому точному
+    URL_EXACT_MATCH = os.getenv('URL_EXACT_MATCH', 'true').lower() in ('1', 'true', 'yes')
 
     # App
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     DAYS_BACK = int(os.getenv('DAYS_BACK', 20))
+    REFRESH_DAYS = int(os.getenv('REFRESH_DAYS', 3))
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', 500))
+    API_CACHE_SIZE = int(os.getenv('API_CACHE_SIZE', 256))
+    # Adaptive API concurrency (AIMD): фактический параллелизм подбирается сам
+    API_INITIAL_CONCURRENCY = int(os.getenv('API_INITIAL_CONCURRENCY', 2))
+    API_MAX_CONCURRENCY = int(os.getenv('API_MAX_CONCURRENCY', 16))
+    DAILY_REQUEST_QUOTA = int(os.getenv('DAILY_REQUEST_QUOTA', 10000))
+    FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', API_MAX_CONCURRENCY))
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 64))
+    # Дедупликация по заранее загруженным ключам даты (set / Bloom для больших дат)
+    PRELOAD_KEYS = os.getenv('PRELOAD_KEYS', 'true').lower() in ('1', 'true', 'yes')
+    BLOOM_THRESHOLD = int(os.getenv('BLOOM_THRESHOLD', 2000000))
+
+    # Distributed job queue
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    WORKER_POLL_SECONDS = int(os.getenv('WORKER_POLL_SECONDS', 10))
+
+    # Daemon (DAEMON_PORT=0 - без HTTP health endpoint)
+    DAEMON_POLL_SECONDS = int(os.getenv('DAEMON_POLL_SECONDS', 900))
+    DAEMON_HOST = os.getenv('DAEMON_HOST', '127.0.0.1')
+    DAEMON_PORT = int(os.getenv('DAEMON_PORT', 8080))
+    COPY_CHUNK_SIZE = int(os.getenv('COPY_CHUNK_SIZE', 50000))
+    ETL_CHUNK_SIZE = int(os.getenv('ETL_CHUNK_SIZE', 20000))
+
+    # Export (пустой EXPORT_DIR - экспорт выключен)
+    EXPORT_DIR = os.getenv('EXPORT_DIR', '')
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 100000))
+
+    # Hot/cold tiering: даты старше ARCHIVE_AFTER_DAYS уходят в *_cold (0 - выключено)
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+    COLD_TABLESPACE = os.getenv('COLD_TABLESPACE', '')
 
     @property
     def db(self):
@@ -51,7 +84,29 @@ class Settings:
         class App:
             log_level = Settings.LOG_LEVEL
             days_back = Settings.DAYS_BACK
+            url_exact_match = Settings.URL_EXACT_MATCH
+            refresh_days = Settings.REFRESH_DAYS
             batch_size = Settings.BATCH_SIZE
+            api_cache_size = Settings.API_CACHE_SIZE
+            fetch_workers = Settings.FETCH_WORKERS
+            api_initial_concurrency = Settings.API_INITIAL_CONCURRENCY
+            api_max_concurrency = Settings.API_MAX_CONCURRENCY
+            daily_request_quota = Settings.DAILY_REQUEST_QUOTA
+            pipeline_queue_size = Settings.PIPELINE_QUEUE_SIZE
+            preload_keys = Settings.PRELOAD_KEYS
+            bloom_threshold = Settings.BLOOM_THRESHOLD
+            job_lease_seconds = Settings.JOB_LEASE_SECONDS
+            job_max_attempts = Settings.JOB_MAX_ATTEMPTS
+            worker_poll_seconds = Settings.WORKER_POLL_SECONDS
+            daemon_poll_seconds = Settings.DAEMON_POLL_SECONDS
+            daemon_host = Settings.DAEMON_HOST
+            daemon_port = Settings.DAEMON_PORT
+            copy_chunk_size = Settings.COPY_CHUNK_SIZE
+            etl_chunk_size = Settings.ETL_CHUNK_SIZE
+            export_dir = Settings.EXPORT_DIR
+            export_chunk_size = Settings.EXPORT_CHUNK_SIZE
+            archive_after_days = Settings.ARCHIVE_AFTER_DAYS
+            cold_tablespace = Settings.COLD_TABLESPACE
         return App()
 
 
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Compare peak memory of batch vs streaming ETL extraction.
+
+Usage:
+    python scripts/benchmark_etl_memory.py batch|stream [CHUNK_SIZE]
+
+Только чтение: извлекает новые строки rdl и прогоняет бизнес-логику,
+в ppl ничего не пишет. Каждый режим запускайте отдельным процессом -
+пиковый RSS считается на процесс.
+"""
+import sys
+import os
+import time
+import resource
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def main():
+    from etl.webmaster_processor import WebmasterETLProcessor
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'stream'
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    processor = WebmasterETLProcessor()
+    last_date = processor.get_last_processed_date()
+
+    start = time.perf_counter()
+    rows = 0
+    if mode == 'batch':
+        rows = len(processor.apply_business_logic(processor.get_new_rdl_data(last_date)))
+    else:
+        # Как в run_etl_streaming: без фильтра по дате, только NOT EXISTS
+        for chunk in processor.iter_new_rdl_chunks(None, chunk_size):
+            rows += len(processor.apply_business_logic(chunk))
+    elapsed = time.perf_counter() - start
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB на Linux
+    print(f"mode={mode} rows={rows} time={elapsed:.1f}s "
+          f"rate={rows / elapsed if elapsed else 0:.0f} rows/s peak_rss={peak_mb:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
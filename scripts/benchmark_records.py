@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark memory and throughput of in-flight row representations.
+
+Usage:
+    python scripts/benchmark_records.py [ROWS]
+
+Сравнивает dict / WebmasterRecord / ORM WebmasterData по памяти и скорости
+сериализации в CSV-буфер для COPY. Результат экстраполируется на день
+в 5M строк. Подключение к БД не требуется.
+"""
+import sys
+import os
+import csv
+import io
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.records import WebmasterRecord, RECORD_FIELDS
+
+TARGET_ROWS = 5_000_000
+
+
+def make_dict(i: int, day: date) -> dict:
+    return {
+        'date': day,
+        'page_path': f'https://example.com/catalog/{i % 5000}',
+        'query': f'query text {i}',
+        'demand': i % 100,
+        'impressions': i % 50,
+        'clicks': i % 5,
+        'position': 1.0 + (i % 30),
+        'device': 'desktop'
+    }
+
+
+def make_record(i: int, day: date) -> WebmasterRecord:
+    return WebmasterRecord(**make_dict(i, day))
+
+
+def measure(label: str, factory, rows: int):
+    """Returns (rows list, bytes per row) for the given factory."""
+    day = date(2024, 1, 1)
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = [factory(i, day) for i in range(rows)]
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_row = current / rows
+    print(f"{label:<16} {per_row:8.0f} B/row  "
+          f"{per_row * TARGET_ROWS / 2 ** 30:6.2f} GiB per 5M  "
+          f"build {rows / elapsed:10.0f} rows/s")
+    return data, per_row
+
+
+def serialize(label: str, rows, to_tuple):
+    """Measures CSV (COPY) serialization throughput."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    start = time.perf_counter()
+    for row in rows:
+        writer.writerow(to_tuple(row))
+    elapsed = time.perf_counter() - start
+    rate = len(rows) / elapsed
+    print(f"{label:<16} {rate:10.0f} rows/s  "
+          f"~{TARGET_ROWS / rate:6.1f} s per 5M")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"Rows sampled: {rows} (extrapolated to {TARGET_ROWS})")
+    print("-" * 60)
+
+    dicts, _ = measure('dict', make_dict, rows)
+    records, _ = measure('WebmasterRecord', make_record, rows)
+
+    try:
+        from models.database import WebmasterData
+        orm, _ = measure('WebmasterData', lambda i, d: WebmasterData(**make_dict(i, d)), rows)
+        del orm
+    except Exception as e:
+        print(f"WebmasterData    skipped: {e}")
+
+    print("-" * 60)
+    serialize('dict -> COPY', dicts, lambda r: [r[f] for f in RECORD_FIELDS])
+    serialize('record -> COPY', records, lambda r: r)
+
+
+if __name__ == "__main__":
+    main()
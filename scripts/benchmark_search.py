@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Latency of substring query search: trigram GIN index vs full scan.
+
+Usage:
+    python scripts/benchmark_search.py START END TERM [TERM ...] [--runs N] [--synthetic ROWS]
+
+По каждой подстроке запрос QuerySearch.search() выполняется --runs раз с индексами
+и столько же раз с отключенными index/bitmap scan (как было до индексов:
+полный скан). Печатаются медиана и p95 в мс.
+
+--synthetic ROWS: вместо рабочих данных создается UNLOGGED таблица
+ppl._search_bench с ROWS сгенерированными строками (например 30000000)
+и триграммными индексами; после замера она удаляется.
+"""
+import sys
+import os
+import time
+import statistics
+import logging
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+logging.basicConfig(level=logging.WARNING)
+
+BENCH_TABLE = 'ppl._search_bench'
+WORDS = [
+    'фильтр', 'вода', 'купить', 'картридж', 'обратный', 'осмос', 'кувшин', 'цена',
+    'умягчитель', 'магистральный', 'для', 'дома', 'квартиры', 'скважины', 'замена',
+    'москва', 'отзывы', 'колба', 'аквафор', 'гейзер', 'барьер', 'smart', 'pro', 'mini',
+]
+
+
+def create_synthetic(rows: int):
+    from sqlalchemy import text
+    from models.database import engine
+
+    words = "ARRAY[" + ", ".join(f"'{w}'" for w in WORDS) + "]"
+    n = len(WORDS)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        conn.execute(text(f"CREATE UNLOGGED TABLE {BENCH_TABLE} (LIKE ppl.webmaster_aggregated)"))
+        started = time.perf_counter()
+        conn.execute(text(f"""
+            INSERT INTO {BENCH_TABLE}
+                (id, date, query, page_path, device, demand, impressions, clicks, position)
+            SELECT g, date '2025-01-01' + (g % 365)::int,
+                   w[1 + ((g * 7919) % {n})::int] || ' ' || w[1 + ((g / 3 * 104729) % {n})::int]
+                       || ' ' || (g % 100000),
+                   '/catalog/' || w[1 + ((g / 7) % {n})::int] || '/' || (g % 20000),
+                   (ARRAY['DESKTOP', 'MOBILE', 'TABLET'])[1 + (g % 3)::int],
+                   1 + g % 50, 1 + g % 100, g % 7, 1 + (g % 500) / 10.0
+            FROM generate_series(1::bigint, :rows) g, (SELECT {words} AS w) words
+        """), {'rows': rows})
+        print(f"generated {rows} rows in {time.perf_counter() - started:.0f}s")
+
+        started = time.perf_counter()
+        for column in ('query', 'page_path'):
+            conn.execute(text(
+                f"CREATE INDEX ON {BENCH_TABLE} USING gin ({column} gin_trgm_ops)"
+            ))
+        conn.execute(text(f"VACUUM ANALYZE {BENCH_TABLE}"))
+        size = conn.execute(text(
+            f"SELECT pg_size_pretty(pg_table_size('{BENCH_TABLE}')), "
+            f"pg_size_pretty(pg_indexes_size('{BENCH_TABLE}'))"
+        )).one()
+        print(f"indexes built in {time.perf_counter() - started:.0f}s; table {size[0]}, trgm indexes {size[1]}")
+
+
+def time_search(search, term: str, start: date, end: date, runs: int, full_scan: bool):
+    from sqlalchemy import text
+    from models.database import get_db
+
+    timings = []
+    found = 0
+    for _ in range(runs):
+        sql, params = search.build_search(term, start, end)
+        with get_db() as db:
+            if full_scan:
+                db.execute(text("SET LOCAL enable_bitmapscan = off"))
+                db.execute(text("SET LOCAL enable_indexscan = off"))
+            started = time.perf_counter()
+            rows = db.execute(text(sql), params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        found = rows[0].total if rows else 0
+
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return found, statistics.median(timings), p95
+
+
+def main():
+    from etl.search import QuerySearch
+
+    args = sys.argv[1:]
+    runs, synthetic = 5, 0
+    if '--runs' in args:
+        i = args.index('--runs')
+        runs = int(args[i + 1])
+        del args[i:i + 2]
+    if '--synthetic' in args:
+        i = args.index('--synthetic')
+        synthetic = int(args[i + 1])
+        del args[i:i + 2]
+    if len(args) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    start, end = date.fromisoformat(args[0]), date.fromisoformat(args[1])
+    terms = args[2:]
+
+    search = QuerySearch()
+    if synthetic:
+        create_synthetic(synthetic)
+        search = QuerySearch(source=BENCH_TABLE)
+
+    try:
+        print(f"{'term':<20}{'matches':>10}{'trgm p50':>11}{'p95':>9}{'scan p50':>11}{'p95':>9}{'speedup':>9}")
+        for term in terms:
+            found, trgm_p50, trgm_p95 = time_search(search, term, start, end, runs, full_scan=False)
+            _, scan_p50, scan_p95 = time_search(search, term, start, end, runs, full_scan=True)
+            print(f"{term:<20}{found:>10}{trgm_p50:>9.0f}ms{trgm_p95:>7.0f}ms"
+                  f"{scan_p50:>9.0f}ms{scan_p95:>7.0f}ms{scan_p50 / trgm_p50 if trgm_p50 else 0:>8.1f}x")
+    finally:
+        if synthetic:
+            from sqlalchemy import text
+            from models.database import engine
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Clean-data write throughput: BatchWriter vs bulk copy_records.
+
+Usage:
+    python scripts/benchmark_writes.py [ROWS] [BATCH_SIZE]
+
+Пишет ROWS синтетических строк за служебную дату 1900-01-01 в rdl.webm_api
+двумя способами и после каждого замера удаляет их:
+  - BatchWriter порциями по BATCH_SIZE (по умолчанию BATCH_SIZE из настроек),
+    каждая порция - своя транзакция с savepoint;
+  - copy_records порциями по COPY_CHUNK_SIZE, одна транзакция на порцию.
+Нужна рабочая БД.
+"""
+import sys
+import os
+import time
+import logging
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+logging.basicConfig(level=logging.WARNING)
+
+BENCH_DATE = date(1900, 1, 1)
+DEVICES = ('DESKTOP', 'MOBILE', 'TABLET')
+
+
+def make_records(rows: int):
+    from models.records import WebmasterRecord
+
+    return [
+        WebmasterRecord(
+            date=BENCH_DATE,
+            page_path=f'https://example.com/catalog/{i % 5000}',
+            query=f'фильтр для воды {i}',
+            demand=i % 50,
+            impressions=1 + i % 100,
+            clicks=i % 7,
+            position=1 + (i % 500) / 10,
+            device=DEVICES[i % 3],
+        )
+        for i in range(rows)
+    ]
+
+
+def cleanup():
+    from sqlalchemy import text
+    from models.database import get_db
+
+    with get_db() as db:
+        db.execute(text("DELETE FROM rdl.webm_api WHERE date = :d"), {'d': BENCH_DATE})
+
+
+def report(label: str, rows: int, elapsed: float):
+    print(f"{label:<34} {rows / elapsed:10.0f} rows/s  "
+          f"~{5_000_000 / (rows / elapsed):6.0f} s per 5M")
+
+
+def main():
+    from config.settings import settings
+    from models.database import get_db, copy_records
+    from services.batch_writer import BatchWriter
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else settings.app.batch_size
+    chunk_size = settings.app.copy_chunk_size
+    records = make_records(rows)
+    cleanup()
+
+    try:
+        started = time.perf_counter()
+        stats = BatchWriter(batch_size).write(records)
+        report(f"BatchWriter (batch {batch_size})", stats['saved'], time.perf_counter() - started)
+        cleanup()
+
+        started = time.perf_counter()
+        saved = 0
+        for start in range(0, rows, chunk_size):
+            with get_db() as db:
+                saved += copy_records(db, records[start:start + chunk_size])
+        report(f"copy_records (chunk {chunk_size})", saved, time.perf_counter() - started)
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -23,13 +23,20 @@ def main():
     logger.info("=" * 60)
     
     processor = WebmasterETLProcessor()
-    result = processor.run_etl()
+    result = processor.run_etl(streaming='--stream' in sys.argv)
     
     if result > 0:
         logger.info(f"✅ Successfully processed {result} rows")
     else:
         logger.info("✅ No new data to process")
     
+    from config.settings import settings
+    if settings.app.export_dir:
+        from etl.parquet_export import ParquetExporter
+        
+        exported = ParquetExporter().export_pending()
+        logger.info(f"✅ Exported {exported} rows to Parquet ({settings.app.export_dir})")
+    
     logger.info("=" * 60)
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+"""AIMD concurrency limiter for Webmaster API calls."""
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _is_throttled(status: Optional[int]) -> bool:
+    """429, 5xx and transport errors (status None) are congestion signals."""
+    return status is None or status == 429 or status >= 500
+
+
+class AdaptiveConcurrencyLimiter:
+    """Ограничивает число одновременных запросов к API и подстраивает его.
+
+    Additive increase / multiplicative decrease: после каждого окна из
+    window успешных запросов с нормальной задержкой лимит растет на 1,
+    если за окно он был занят целиком; 429/5xx/ошибка соединения сразу
+    уменьшают его вдвое, а рост p90 задержки выше latency_factor × базовой -
+    на четверть. Окно и базовая задержка (минимальная медиана окна,
+    медленно дрейфующая вверх) строятся только по успешным ответам;
+    ответы на запросы, начатые до последнего снижения, не учитываются.
+    """
+
+    def __init__(self, initial: Optional[int] = None, min_limit: int = 1,
+                 max_limit: Optional[int] = None, window: int = 20,
+                 latency_factor: float = 2.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit or settings.app.api_max_concurrency
+        self.limit = float(initial or settings.app.api_initial_concurrency)
+        self.window = window
+        self.latency_factor = latency_factor
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+
+        self._in_flight = 0
+        self._saturated = False  # лимит был достигнут за текущее окно
+        self._latencies: List[float] = []
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self._in_flight += 1
+            if self._in_flight >= int(self.limit):
+                self._saturated = True
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def call(self, method: Callable, *args, **kwargs):
+        """Run an HTTP call (e.g. session.get) under the limit and record its outcome."""
+        self.acquire()
+        started = time.monotonic()
+        status = None
+        try:
+            response = method(*args, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            self.release()
+            self.record(time.monotonic() - started, status, started)
+
+    def record(self, latency: float, status: Optional[int], started: Optional[float] = None):
+        with self._cond:
+            # Запросы, начатые до последнего снижения, измеряли старый лимит:
+            # ни снижать его повторно, ни попадать в окно они не должны
+            if started is not None and started < self._last_decrease:
+                return
+            if _is_throttled(status):
+                self._decrease(0.5, f"throttled/failed response (status {status})")
+            else:
+                # В окно и базовую задержку идут только успешные ответы
+                self._latencies.append(latency)
+                if len(self._latencies) >= self.window:
+                    self._adjust()
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, reason: str):
+        old_limit = self.limit
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = time.monotonic()
+        self._latencies = []
+        self._saturated = False
+        if int(old_limit) != int(self.limit):
+            logger.info(f"API concurrency {int(old_limit)} -> {int(self.limit)}: {reason}")
+
+    def _adjust(self):
+        latencies, self._latencies = sorted(self._latencies), []
+        median = latencies[len(latencies) // 2]
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+
+        if self.baseline is not None and p90 > self.baseline * self.latency_factor:
+            self._decrease(0.75, f"p90 latency {p90:.2f}s > {self.latency_factor}x baseline {self.baseline:.2f}s")
+            return
+
+        self.baseline = median if self.baseline is None else min(median, self.baseline * 1.05)
+        # Растем, только если текущий лимит действительно был занят целиком:
+        # последовательные вызовы не должны разгонять его до максимума
+        if self._saturated and self.limit < self.max_limit:
+            old_limit = self.limit
+            self.limit = min(self.max_limit, self.limit + 1)
+            if int(old_limit) != int(self.limit):
+                logger.info(f"API concurrency {int(old_limit)} -> {int(self.limit)}: healthy window, p90 {p90:.2f}s")
+        self._saturated = self._in_flight >= int(self.limit)
+
+
+_limiter: Optional[AdaptiveConcurrencyLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> AdaptiveConcurrencyLimiter:
+    """Process-wide limiter shared by all API clients (one quota per token)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveConcurrencyLimiter()
+        return _limiter
@@ -1,11 +1,18 @@
 import requests
-from typing import List, Dict, Any
+import threading
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, Iterator, Optional
 from datetime import datetime
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from config.settings import settings
+from models.records import WebmasterRecord
+from api.cache import ResponseCache
+from api.concurrency import get_limiter
+
+PAGE_SIZE = 500  # строк search-queries на страницу
 
 
 class WebmasterClient:
@@ -17,6 +24,47 @@ class WebmasterClient:
         }
         self.user_id = settings.api.user_id
         self.host_id = settings.api.host_id
+        # Одна сессия на клиента - keep-alive соединения переиспользуются
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=settings.app.api_max_concurrency))
+        # Общий AIMD-лимитер параллельных запросов к API
+        self.limiter = get_limiter()
+        # Счетчики реальных (не из кеша) запросов - для метрик и планировщика
+        self.requests_made = 0
+        self.bytes_downloaded = 0
+        self._counter_lock = threading.Lock()
+
+        # Кеш ответов на время запуска: (endpoint, params) -> JSON
+        self.cache = ResponseCache(settings.app.api_cache_size)
+        # date -> {page_url: [строки search-queries]}
+        self.page_index = ResponseCache(settings.app.api_cache_size)
+
+    def _get_json(self, url: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """GET с мемоизацией успешных ответов. None при ошибке HTTP."""
+        key = ResponseCache.make_key(url, params)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        response = self.limiter.call(self.session.get, url, headers=self.headers, params=params)
+        self._count(response)
+        if response.status_code != 200:
+            print(f"Ошибка {response.status_code} для {params}")
+            print(f"Response: {response.text[:200]}")
+            return None
+
+        data = response.json()
+        self.cache.put(key, data)
+        return data
+
+    def _count(self, response):
+        with self._counter_lock:
+            self.requests_made += 1
+            self.bytes_downloaded += len(response.content)
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.page_index.clear()
 
     def check_date_has_data(self, target_date: str) -> bool:
         # В API v4 endpoint может отличаться от v4.2
@@ -29,7 +77,8 @@ class WebmasterClient:
         }
 
         try:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.limiter.call(self.session.get, url, headers=self.headers, params=params)
+            self._count(response)
             if response.status_code == 200:
                 data = response.json()
                 # В v4 структура ответа может быть другой
@@ -38,80 +87,123 @@ class WebmasterClient:
         except:
             return False
 
-    def get_urls_for_date(self, target_date: str) -> List[str]:
-        """Получает все уникальные URL для указанной даты - АДАПТИРУЕМ ПОД v4"""
-        # В v4 нужно использовать другой подход
-        # Пока упростим - будем использовать старый endpoint если работает
+    def iter_query_pages(self, target_date: str) -> Iterator[List[Dict[str, Any]]]:
+        """Страницы search-queries за дату по PAGE_SIZE строк (повторно - из кеша).
+
+        Ошибка HTTP прерывает листание с RuntimeError.
+        """
         url = f'{self.base_url}/user/{self.user_id}/hosts/{self.host_id}/search-queries'
-        urls = set()
         offset = 0
-        limit = 500
 
         while True:
             params = {
                 "date_from": target_date,
                 "date_to": target_date,
-                "limit": limit,
+                "limit": PAGE_SIZE,
                 "offset": offset
             }
+            data = self._get_json(url, params)
+            if data is None:
+                raise RuntimeError(f"search-queries за {target_date} (offset {offset}) не получены")
 
-            try:
-                response = requests.get(url, headers=self.headers, params=params)
-                if response.status_code == 200:
-                    data = response.json()
-                    queries = data.get('queries', [])
-
-                    if not queries:
-                        break
+            queries = data.get('queries', [])
+            if queries:
+                yield queries
+            if len(queries) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
 
-                    for query in queries:
-                        url_value = query.get('page_url', '')
-                        if url_value and url_value != 'N/A':
-                            urls.add(url_value)
-
-                    if len(queries) < limit:
-                        break
-
-                    offset += limit
-                else:
-                    print(f"Ошибка при получении URL за {target_date}: {response.status_code}")
-                    print(f"Response: {response.text[:200]}")
-                    break
-            except Exception as e:
-                print(f"Ошибка при получении URL: {e}")
-                break
+    def get_urls_for_date(self, target_date: str) -> List[str]:
+        """Получает все уникальные URL для указанной даты - АДАПТИРУЕМ ПОД v4"""
+        # В v4 нужно использовать другой подход
+        # Пока упростим - будем использовать старый endpoint если работает
+        urls = set()
+        try:
+            for queries in self.iter_query_pages(target_date):
+                for query in queries:
+                    url_value = query.get('page_url', '')
+                    if url_value and url_value != 'N/A':
+                        urls.add(url_value)
+        except Exception as e:
+            print(f"Ошибка при получении URL: {e}")
 
         return list(urls)
 
-    def get_queries_for_url_and_date(self, target_date: str, page_url: str, device: str) -> List[Dict[str, Any]]:
-        """В v4 может не быть такого endpoint - нужно адаптировать"""
-        # Упрощенная версия для v4
+    def probe_row_count(self, target_date: str) -> Optional[int]:
+        """Число строк search-queries за дату по первой странице (для планировщика).
+
+        Страница та же, что у get_urls_for_date, и остается в кеше.
+        None - если API не вернул count, а страница заполнена целиком,
+        или запрос не удался (планировщик возьмет оценку из истории).
+        """
         url = f'{self.base_url}/user/{self.user_id}/hosts/{self.host_id}/search-queries'
         params = {
             "date_from": target_date,
             "date_to": target_date,
-            "limit": 500
+            "limit": PAGE_SIZE,
+            "offset": 0
         }
-
-        data_rows = []
-
         try:
-            response = requests.get(url, headers=self.headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                for query in data.get('queries', []):
-                    if query.get('page_url') == page_url:
-                        data_rows.append({
-                            'date': datetime.strptime(target_date, '%Y-%m-%d').date(),
-                            'page_path': page_url,
-                            'query': query.get('query_text', 'N/A'),
-                            'demand': int(query.get('impressions', 0)),  # В v4 может не быть demand
-                            'impressions': int(float(query.get('impressions', 0))),
-                            'clicks': int(float(query.get('clicks', 0))),
-                            'position': float(query.get('position', 0)),
-                            'device': device.lower()
-                        })
+            data = self._get_json(url, params)
+        except Exception as e:
+            print(f"Ошибка пробы строк за {target_date}: {e}")
+            return None
+        if data is None:
+            return None
+        if data.get('count') is not None:
+            return int(data['count'])
+        queries = data.get('queries', [])
+        return len(queries) if len(queries) < PAGE_SIZE else None
+
+    def _get_page_index(self, target_date: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Группирует строки search-queries за дату по page_url (один раз на дату).
+
+        Индекс строится по всем страницам даты - после get_urls_for_date
+        они уже в кеше, повторных запросов нет.
+        """
+        index = self.page_index.get(target_date)
+        if index is not None:
+            return index
+
+        index = {}
+        try:
+            for queries in self.iter_query_pages(target_date):
+                for query in queries:
+                    index.setdefault(query.get('page_url'), []).append(query)
+        except Exception as e:
+            # Ошибку не кешируем - следующий вызов повторит запрос
+            print(f"Ошибка при получении строк за {target_date}: {e}")
+            return {}
+
+        self.page_index.put(target_date, index)
+        return index
+
+    def records_from_rows(self, target_date: str, rows: List[Dict[str, Any]], device: str) -> List[WebmasterRecord]:
+        """Строки search-queries -> записи rdl для устройства."""
+        row_date = datetime.strptime(target_date, '%Y-%m-%d').date()
+        device_value = device.lower()
+        return [
+            WebmasterRecord(
+                date=row_date,
+                page_path=query.get('page_url'),
+                query=query.get('query_text', 'N/A'),
+                demand=int(query.get('impressions', 0)),  # В v4 может не быть demand
+                impressions=int(float(query.get('impressions', 0))),
+                clicks=int(float(query.get('clicks', 0))),
+                position=float(query.get('position', 0)),
+                device=device_value
+            )
+            for query in rows
+        ]
+
+    def get_queries_for_url_and_date(self, target_date: str, page_url: str, device: str) -> List[WebmasterRecord]:
+        """В v4 может не быть такого endpoint - нужно адаптировать"""
+        # Упрощенная версия для v4: страницы за дату скачиваются один раз,
+        # дальше строки берутся из индекса по page_url
+        try:
+            return self.records_from_rows(
+                target_date, self._get_page_index(target_date).get(page_url, []), device
+            )
         except Exception as e:
             print(f"Error: {e}")
-
-        return data_rows
+            return []
@@ -1,5 +1,6 @@
 """Main data collector for Yandex Webmaster."""
 import logging
+import time
 from typing import Optional, List
 from datetime import datetime
 
@@ -7,7 +8,10 @@ from config.settings import settings
 from api.webmaster_client import WebmasterClient
 from services.date_manager import DateManager
 from services.data_loader import DataLoader
-from models.database import create_tables
+from models.database import create_all_tables, get_db, WebmasterRunMetrics
+from etl.webmaster_processor import WebmasterETLProcessor
+from core.webmaster_loader import WebmasterDataLoader
+from services.job_queue import JobQueue, JobWorker
 
 
 class WebmasterCollector:
@@ -20,6 +24,8 @@ class WebmasterCollector:
         self.client = WebmasterClient()
         self.date_manager = DateManager(self.client)
         self.data_loader = DataLoader(self.client)
+        # Даты, которые не удалось загрузить целиком (для health демона)
+        self.failed_dates: List[str] = []
         
         # Настройка логирования
         logging.basicConfig(
@@ -31,7 +37,7 @@ class WebmasterCollector:
         """Initialize database tables."""
         self.logger.info("Initializing database...")
         try:
-            create_tables()
+            create_all_tables()
             self.logger.info("Database initialized successfully")
         except Exception as e:
             self.logger.error(f"Failed to initialize database: {e}")
@@ -42,9 +48,30 @@ class WebmasterCollector:
         self.logger.info(f"Starting collection for date: {target_date}")
         
         try:
+            started = time.perf_counter()
+            requests_before = self.client.requests_made
+            bytes_before = self.client.bytes_downloaded
+            
             # Загружаем данные за дату
             records_count = self.data_loader.load_data_for_date(target_date)
             
+            self._record_metrics(
+                target_date,
+                urls=self.data_loader.last_url_count,
+                requests=self.client.requests_made - requests_before,
+                rows=self.data_loader.last_rows_fetched,
+                bytes=self.client.bytes_downloaded - bytes_before,
+                seconds=time.perf_counter() - started
+            )
+            
+            if self.data_loader.last_failed_batches:
+                self.failed_dates.append(target_date)
+            else:
+                # Дата загружена целиком - задачи очереди за нее больше не нужны
+                cleared = JobQueue().clear_date(datetime.strptime(target_date, '%Y-%m-%d').date())
+                if cleared:
+                    self.logger.info(f"Cleared {cleared} unfinished queue tasks for {target_date}")
+            
             if records_count > 0:
                 self.logger.info(f"Successfully collected {records_count} records for {target_date}")
             else:
@@ -54,8 +81,20 @@ class WebmasterCollector:
             
         except Exception as e:
             self.logger.error(f"Failed to collect data for {target_date}: {e}")
+            self.failed_dates.append(target_date)
             return 0
     
+    def _record_metrics(self, target_date: str, **metrics):
+        """Save per-date run costs used by the backfill planner."""
+        try:
+            with get_db() as db:
+                db.merge(WebmasterRunMetrics(
+                    date=datetime.strptime(target_date, '%Y-%m-%d').date(),
+                    **metrics
+                ))
+        except Exception as e:
+            self.logger.warning(f"Failed to record run metrics for {target_date}: {e}")
+    
     def collect_missing_data(self) -> int:
         """Collect missing data for recent dates."""
         self.logger.info("Starting collection of missing data...")
@@ -101,6 +140,89 @@ class WebmasterCollector:
         self.logger.info(f"Period collection completed: {total_records} records")
         return total_records
     
+    def refresh_recent(self, days: Optional[int] = None) -> dict:
+        """Re-fetch last N days and write only revised rows (rdl + ppl)."""
+        from datetime import datetime as dt, timedelta
+        
+        days = days or settings.app.refresh_days
+        today = dt.now().date()
+        dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days, 0, -1)]
+        self.logger.info(f"Refreshing last {days} days: {dates}")
+        
+        processor = WebmasterETLProcessor()
+        totals = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        
+        for date_str in dates:
+            try:
+                stats, changed = self.data_loader.refresh_data_for_date(
+                    date_str,
+                    propagate=lambda db, changed: processor.propagate_changes(changed, db=db)
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to refresh {date_str}: {e}")
+                continue
+            
+            for key in totals:
+                totals[key] += stats[key]
+            processor.refresh_rollups(row.date for row in changed)
+        
+        self.logger.info(
+            f"Refresh completed: {totals['inserted']} inserted, "
+            f"{totals['updated']} updated, {totals['unchanged']} unchanged"
+        )
+        return totals
+    
+    def enqueue_missing_dates(self) -> int:
+        """Put URL × device tasks for missing dates into the job table."""
+        from datetime import datetime as dt
+        
+        missing_dates = self.date_manager.get_missing_dates()
+        loader = WebmasterDataLoader()
+        queue = JobQueue()
+        
+        total_tasks = 0
+        for date_str in missing_dates:
+            urls = loader.get_all_urls_for_date(date_str)
+            added = queue.enqueue_date(dt.strptime(date_str, '%Y-%m-%d').date(), urls)
+            self.logger.info(f"Enqueued {added} tasks for {date_str} ({len(urls)} URLs)")
+            total_tasks += added
+        
+        return total_tasks
+    
+    def requeue_failed(self) -> int:
+        """Give failed queue tasks a fresh set of attempts."""
+        requeued = JobQueue().requeue_failed()
+        self.logger.info(f"Requeued {requeued} failed tasks")
+        return requeued
+    
+    def run_worker(self, forever: bool = False) -> int:
+        """Process tasks from the job table (any number of workers in parallel)."""
+        return JobWorker(WebmasterDataLoader()).run(forever=forever)
+    
+    def plan_period(self, start_date: str, end_date: str):
+        """Dry run: estimate cost of collecting a period without fetching data."""
+        from services.planner import BackfillPlanner
+        
+        planner = BackfillPlanner(self.client)
+        plans = planner.plan_period(start_date, end_date)
+        planner.print_plan(plans)
+        return plans
+    
+    def archive_old_data(self, measure: bool = False) -> dict:
+        """Move dates older than ARCHIVE_AFTER_DAYS to the cold tables."""
+        from etl.tiering import StorageTiering
+        
+        report = StorageTiering().archive(measure=measure)
+        for table, item in report.items():
+            print(f"{table}: {item['dates']} dates, {item['moved']} rows archived")
+            if 'after' not in item:
+                continue
+            before, after = item['before'], item['after']
+            print(f"  index size   {before['index_bytes'] / 2 ** 20:10.1f} -> {after['index_bytes'] / 2 ** 20:.1f} MiB")
+            print(f"  table size   {before['table_bytes'] / 2 ** 20:10.1f} -> {after['table_bytes'] / 2 ** 20:.1f} MiB")
+            print(f"  vacuum time  {before['vacuum_seconds']:10.2f} -> {after['vacuum_seconds']:.2f} s")
+        return report
+    
     def collect_yesterday(self) -> int:
         """Collect data for yesterday."""
         from datetime import datetime as dt, timedelta
@@ -128,9 +250,36 @@ def main():
             collector.collect_yesterday()
         elif arg == '--init' or arg == '-i':
             collector.initialize_database()
+        elif arg == '--refresh' or arg == '-r':
+            collector.refresh_recent()
+        elif arg == '--enqueue':
+            collector.enqueue_missing_dates()
+        elif arg == '--worker':
+            collector.run_worker()
+        elif arg == '--requeue':
+            collector.requeue_failed()
+        elif arg == '--archive':
+            collector.archive_old_data()
+        elif arg == '--rollups':
+            from etl.rollups import RollupManager
+            RollupManager().rebuild_all()
+        elif arg == '--search-index':
+            from models.database import create_search_indexes
+            create_search_indexes(concurrently=True)
+        elif arg == '--daemon':
+            from core.daemon import WebmasterDaemon
+            WebmasterDaemon().run()
         else:
             # Предполагаем что это дата
             collector.collect_for_date(arg)
+    elif len(sys.argv) == 3 and sys.argv[1] in ('--refresh', '-r'):
+        collector.refresh_recent(int(sys.argv[2]))
+    elif len(sys.argv) == 3 and sys.argv[1:] == ['--archive', '--measure']:
+        collector.archive_old_data(measure=True)
+    elif len(sys.argv) == 3 and sys.argv[1:] == ['--worker', '--forever']:
+        collector.run_worker(forever=True)
+    elif len(sys.argv) == 4 and sys.argv[1] == '--plan':
+        collector.plan_period(sys.argv[2], sys.argv[3])
     elif len(sys.argv) == 3:
         # Период
         collector.collect_for_period(sys.argv[1], sys.argv[2])
@@ -140,7 +289,16 @@ def main():
         print("  python -m core.collector --yesterday        # Collect yesterday's data")
         print("  python -m core.collector YYYY-MM-DD         # Collect specific date")
         print("  python -m core.collector YYYY-MM-DD YYYY-MM-DD  # Collect period")
+        print("  python -m core.collector --plan YYYY-MM-DD YYYY-MM-DD  # Estimate period cost (dry run)")
         print("  python -m core.collector --init             # Initialize database")
+        print("  python -m core.collector --refresh [DAYS]   # Re-fetch recent days, update revised rows")
+        print("  python -m core.collector --enqueue          # Queue URL x device tasks for missing dates")
+        print("  python -m core.collector --worker [--forever]  # Process queued tasks")
+        print("  python -m core.collector --requeue          # Retry failed queue tasks")
+        print("  python -m core.collector --archive [--measure]  # Move old dates to cold storage")
+        print("  python -m core.collector --rollups          # Rebuild week/month rollups for all history")
+        print("  python -m core.collector --search-index     # Build trigram indexes for query search")
+        print("  python -m core.collector --daemon           # Poll, collect and run ETL continuously")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+"""Long-running daemon: polls date availability, collects, runs ETL, serves health."""
+import json
+import logging
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from config.settings import settings
+from core.collector import WebmasterCollector
+from etl.webmaster_processor import WebmasterETLProcessor
+from models.database import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class WebmasterDaemon:
+    """Один процесс вместо cron-запусков.
+
+    Движок БД, HTTP-сессия клиента и его кеши создаются один раз и
+    переиспользуются между циклами. Каждые DAEMON_POLL_SECONDS проверяются
+    недостающие даты (в API опрашиваются только даты, которых нет в БД),
+    собираются, и запускается ETL - если что-то собрано или в rdl остались
+    строки, не перенесенные в ppl (например, после упавшего прогона); затем
+    экспорт, если задан EXPORT_DIR. Цикл считается неуспешным, если БД
+    недоступна, хотя бы одна дата не загрузилась или ETL завершился ошибкой.
+    Состояние доступно по HTTP: /health и /status.
+    """
+
+    def __init__(self, poll_seconds: Optional[int] = None, port: Optional[int] = None):
+        self.poll_seconds = poll_seconds or settings.app.daemon_poll_seconds
+        self.port = settings.app.daemon_port if port is None else port
+
+        self.collector = WebmasterCollector()
+        self.processor = WebmasterETLProcessor()
+        self.exporter = None
+        if settings.app.export_dir:
+            from etl.parquet_export import ParquetExporter
+            self.exporter = ParquetExporter()
+
+        self._stop = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+        self.state: Dict[str, Any] = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'cycles': 0,
+            'last_cycle_at': None,
+            'last_success_at': None,
+            'last_error': None,
+            'last_cycle_seconds': None,
+            'records_collected': 0,
+            'rows_processed': 0,
+            'failed_dates': [],
+        }
+
+    def _update_state(self, **values):
+        with self._lock:
+            self.state.update(values)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.state)
+
+    def is_healthy(self) -> bool:
+        """Healthy when the last cycle succeeded within two poll intervals."""
+        state = self.snapshot()
+        if state['last_error']:
+            return False
+        if state['last_success_at'] is None:
+            return state['cycles'] == 0
+        last_success = datetime.fromisoformat(state['last_success_at'])
+        return (datetime.now() - last_success).total_seconds() < 2 * self.poll_seconds + 60
+
+    def run_cycle(self) -> int:
+        """One poll -> collect -> ETL -> export cycle. Returns records collected."""
+        started = time.perf_counter()
+        self._update_state(last_cycle_at=datetime.now().isoformat(timespec='seconds'))
+        try:
+            # Сбор и ETL глотают ошибки БД и возвращают 0 - проверяем явно
+            with get_db() as db:
+                db.execute(text("SELECT 1"))
+            
+            self.collector.failed_dates = []
+            collected = self.collector.collect_missing_data()
+            errors = []
+            if self.collector.failed_dates:
+                errors.append(f"{len(self.collector.failed_dates)} dates failed: "
+                              f"{', '.join(self.collector.failed_dates)}")
+            
+            processed = 0
+            if collected or self.processor.has_pending_rows():
+                processed = self.processor.run_etl(streaming=True)
+                if self.processor.last_error:
+                    errors.append(f"ETL: {self.processor.last_error}")
+            if self.exporter and (collected or processed):
+                self.exporter.export_pending()
+            
+            state = self.snapshot()
+            values = dict(
+                cycles=state['cycles'] + 1,
+                last_cycle_seconds=round(time.perf_counter() - started, 1),
+                records_collected=state['records_collected'] + collected,
+                rows_processed=state['rows_processed'] + processed,
+                failed_dates=list(self.collector.failed_dates),
+                last_error='; '.join(errors)[:500] or None,
+            )
+            if not errors:
+                values['last_success_at'] = datetime.now().isoformat(timespec='seconds')
+            self._update_state(**values)
+            return collected
+        except Exception as e:
+            logger.error(f"Daemon cycle failed: {e}")
+            self._update_state(
+                cycles=self.snapshot()['cycles'] + 1,
+                last_error=str(e)[:500],
+                last_cycle_seconds=round(time.perf_counter() - started, 1),
+            )
+            return 0
+        finally:
+            # Страницы API кешируются в пределах цикла, между циклами - свежие данные
+            self.collector.client.clear_cache()
+
+    def _make_handler(self):
+        daemon = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/health':
+                    healthy = daemon.is_healthy()
+                    body = {'status': 'ok' if healthy else 'unhealthy'}
+                    code = 200 if healthy else 503
+                elif self.path == '/status':
+                    body, code = daemon.snapshot(), 200
+                else:
+                    body, code = {'error': 'not found'}, 404
+
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return HealthHandler
+
+    def start_http(self):
+        if not self.port:
+            return
+        self._server = ThreadingHTTPServer((settings.app.daemon_host, self.port), self._make_handler())
+        threading.Thread(target=self._server.serve_forever, name='health-http', daemon=True).start()
+        logger.info(f"Health endpoint: http://{settings.app.daemon_host}:{self.port}/health")
+
+    def stop(self, *_):
+        logger.info("Stopping daemon...")
+        self._stop.set()
+
+    def run(self):
+        """Run cycles until SIGINT/SIGTERM."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.start_http()
+        logger.info(f"Daemon started, poll interval {self.poll_seconds}s")
+
+        try:
+            while not self._stop.is_set():
+                self.run_cycle()
+                self._stop.wait(self.poll_seconds)
+        finally:
+            if self._server:
+                self._server.shutdown()
+            logger.info("Daemon stopped")
@@ -0,0 +1,166 @@
+"""In-run deduplication of records fetched with URL TEXT_MATCH filters."""
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from models.records import WebmasterRecord
+
+logger = logging.getLogger(__name__)
+
+
+def record_size(record: WebmasterRecord) -> int:
+    """Approximate size of the record in the COPY payload, bytes."""
+    return len(','.join(map(str, record)).encode('utf-8')) + 1
+
+
+def containment_levels(urls: Iterable[str]) -> Dict[str, int]:
+    """Tier of every URL for exact-URL attribution.
+
+    0 - URL не входит ни в один другой URL; иначе 1 + максимальный уровень
+    более длинных URL, содержащих его. URL одного уровня не содержат друг
+    друга: их можно обрабатывать параллельно, когда предыдущие уровни
+    записаны. Вхождения ищутся только с позиций, где начинается начало
+    какого-либо URL, - проверка почти линейна по числу URL.
+    """
+    url_set = {url for url in urls if url}
+    if not url_set:
+        return {}
+    lengths = sorted({len(url) for url in url_set})
+    head = min(lengths[0], 8)
+    heads = {url[:head] for url in url_set}
+
+    containers: Dict[str, List[str]] = {}
+    for longer in url_set:
+        for start in range(len(longer) - head + 1):
+            if longer[start:start + head] not in heads:
+                continue
+            for length in lengths:
+                if start + length > len(longer) or length == len(longer):
+                    break
+                inner = longer[start:start + length]
+                if inner in url_set:
+                    containers.setdefault(inner, []).append(longer)
+
+    # Содержащие URL строго длиннее - к моменту расчета их уровень известен
+    levels: Dict[str, int] = {}
+    for url in sorted(url_set, key=len, reverse=True):
+        levels[url] = 1 + max((levels[c] for c in containers.get(url, ())), default=-1)
+    return levels
+
+
+class RecordDeduplicator:
+    """Отсекает дубликаты до записи в БД.
+
+    Фильтр TEXT_MATCH по URL срабатывает на подстроку, поэтому строка
+    (query, device) для /catalog содержит суммарные метрики /catalog и всех
+    более длинных URL вроде /catalog/filters. В режиме exact_url_match URL
+    обрабатываются от длинных к коротким (см. order_urls, url_tiers), и из строки
+    короткого URL вычитаются уже записанные собственные метрики более
+    длинных URL, содержащих его (клики, показы, средневзвешенная по
+    показам позиция). Строка отбрасывается, только если после вычитания
+    ничего не осталось. Дополнительно ведется индекс
+    (date, page, query, device) - повторы внутри запуска не доходят до writer.
+    """
+
+    def __init__(self, exact_url_match: bool = True):
+        self.exact_url_match = exact_url_match
+        self._seen: Set[Tuple] = set()
+        # (date, query, device) -> [(url, собственные impressions, clicks, position)]
+        self._claims: Dict[Tuple, List[Tuple[str, int, int, float]]] = {}
+        self.stats = {
+            'rows_in': 0,
+            'rows_out': 0,
+            'overlap_adjusted': 0,
+            'overlap_dropped': 0,
+            'duplicate_dropped': 0,
+            'bytes_saved': 0,
+        }
+
+    def add_claims(self, records: List[WebmasterRecord]):
+        """Register rows already attributed to their URLs (e.g. stored by other workers)."""
+        for record in records:
+            self._claims.setdefault((record.date, record.query, record.device), []).append(
+                (record.page_path, record.impressions, record.clicks, record.position)
+            )
+
+    def order_urls(self, urls: List[str]) -> List[str]:
+        """Longest (most specific) URLs first when exact matching is on."""
+        if self.exact_url_match:
+            return sorted(urls, key=len, reverse=True)
+        return list(urls)
+
+    def url_tiers(self, urls: List[str]) -> List[List[str]]:
+        """URLs grouped into tiers that can be fetched concurrently, in processing order.
+
+        Без exact_url_match - один ярус со всеми URL.
+        """
+        if not self.exact_url_match:
+            return [list(urls)] if urls else []
+        levels = containment_levels(urls)
+        tiers: List[List[str]] = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+        for url in self.order_urls(list(levels)):
+            tiers[levels[url]].append(url)
+        return tiers
+
+    def _subtract_claims(self, page_url: str, record: WebmasterRecord,
+                         claim_key: Tuple) -> Optional[WebmasterRecord]:
+        """Own metrics of page_url: the row minus rows of longer URLs containing it.
+
+        None - если собственных показов и кликов не осталось.
+        """
+        claims = [
+            claim for claim in self._claims.get(claim_key, ())
+            if page_url in claim[0] and page_url != claim[0]
+        ]
+        if not claims:
+            return record
+
+        impressions = record.impressions - sum(c[1] for c in claims)
+        clicks = max(0, record.clicks - sum(c[2] for c in claims))
+        if impressions <= 0 and clicks == 0:
+            return None
+
+        position = record.position
+        if impressions > 0:
+            weighted = record.position * record.impressions - sum(c[3] * c[1] for c in claims)
+            position = max(1.0, weighted / impressions)
+        return record._replace(impressions=max(0, impressions), clicks=clicks, position=position)
+
+    def filter(self, page_url: str, records: List[WebmasterRecord]) -> List[WebmasterRecord]:
+        """Returns own-metric records without duplicates; fully covered overlaps are dropped."""
+        kept = []
+        for record in records:
+            self.stats['rows_in'] += 1
+            claim_key = (record.date, record.query, record.device)
+
+            if self.exact_url_match:
+                own = self._subtract_claims(page_url, record, claim_key)
+                if own is None:
+                    self.stats['overlap_dropped'] += 1
+                    self.stats['bytes_saved'] += record_size(record)
+                    continue
+                if own is not record:
+                    self.stats['overlap_adjusted'] += 1
+                record = own
+
+            if record.key in self._seen:
+                self.stats['duplicate_dropped'] += 1
+                self.stats['bytes_saved'] += record_size(record)
+                continue
+
+            self._seen.add(record.key)
+            self._claims.setdefault(claim_key, []).append(
+                (page_url, record.impressions, record.clicks, record.position)
+            )
+            kept.append(record)
+
+        self.stats['rows_out'] += len(kept)
+        return kept
+
+    def log_stats(self, target_date: str):
+        stats = self.stats
+        logger.info(
+            f"Дедупликация за {target_date}: получено {stats['rows_in']}, "
+            f"оставлено {stats['rows_out']}, пересечения URL: скорректировано "
+            f"{stats['overlap_adjusted']}, отброшено целиком {stats['overlap_dropped']}, "
+            f"дубликаты {stats['duplicate_dropped']}, сэкономлено ~{stats['bytes_saved']} байт записи"
+        )
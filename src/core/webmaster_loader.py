@@ -1,11 +1,18 @@
 """Yandex Webmaster data loader."""
 import requests
+from requests.adapters import HTTPAdapter
 import logging
-from typing import List, Dict, Any
+import threading
+from typing import Dict, List, Optional
 from datetime import datetime
 
 from config.settings import settings
-from models.database import get_db, WebmasterData
+from api.concurrency import get_limiter
+from models.records import WebmasterRecord
+from services.batch_writer import BatchWriter
+from core.dedup import RecordDeduplicator
+from services.key_set import ExistingKeySet
+from services.pipeline import FetchWritePipeline
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +28,11 @@ class WebmasterDataLoader:
         }
         self.user_id = settings.api.user_id
         self.host_id = settings.api.host_id
+        self.session = requests.Session()  # keep-alive между запросами
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=settings.app.api_max_concurrency))
+        self.limiter = get_limiter()  # общий AIMD-лимитер параллельных запросов
+        self.bytes_downloaded = 0
+        self._bytes_lock = threading.Lock()  # запросы идут из нескольких потоков
     
     def get_all_urls_for_date(self, target_date: str) -> List[str]:
         """Получает все уникальные URL для указанной даты"""
@@ -49,7 +61,7 @@ class WebmasterDataLoader:
 
             try:
                 logger.debug(f"Отправка запроса: offset={offset}, limit={limit}")
-                response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+                response = self.limiter.call(self.session.post, url, headers=self.headers, json=payload, timeout=30)
                 logger.debug(f"Статус ответа: {response.status_code}")
                 
                 if response.status_code == 200:
@@ -78,8 +90,13 @@ class WebmasterDataLoader:
 
         return list(urls)
 
-    def get_queries_for_url_and_date(self, target_date: str, page_url: str, device: str) -> List[Dict[str, Any]]:
-        """Получает запросы для URL и устройства."""
+    def get_queries_for_url_and_date(self, target_date: str, page_url: str, device: str,
+                                     raise_errors: bool = False) -> List[WebmasterRecord]:
+        """Получает запросы для URL и устройства.
+        
+        По умолчанию ошибки логируются и возвращается пустой список;
+        с raise_errors=True они пробрасываются (нужно для повторов в очереди задач).
+        """
         logger.debug(f"Получение запросов для URL: {page_url}, устройство: {device}")
         
         url = f"{self.base_url}/user/{self.user_id}/hosts/{self.host_id}/query-analytics/list"
@@ -98,12 +115,16 @@ class WebmasterDataLoader:
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+            response = self.limiter.call(self.session.post, url, headers=self.headers, json=payload, timeout=30)
             logger.debug(f"Статус ответа: {response.status_code}")
+            with self._bytes_lock:
+                self.bytes_downloaded += len(response.content)
             
             if response.status_code == 200:
                 data = response.json()
                 data_rows = []
+                row_date = datetime.strptime(target_date, '%Y-%m-%d').date()
+                device_value = device.lower()
                 
                 for item in data.get('text_indicator_to_statistics', []):
                     query_text = item.get('text_indicator', {}).get('value', 'N/A')
@@ -114,56 +135,61 @@ class WebmasterDataLoader:
                             metrics[stat.get('field')] = stat.get('value', 0)
                     
                     # Сохраняем ВСЕ данные, даже с DEMAND = 0
-                    data_rows.append({
-                        'date': datetime.strptime(target_date, '%Y-%m-%d').date(),
-                        'page_path': page_url,
-                        'query': query_text,
-                        'demand': int(metrics.get('DEMAND', 0)),
-                        'impressions': int(float(metrics.get('IMPRESSIONS', 0))),
-                        'clicks': int(float(metrics.get('CLICKS', 0))),
-                        'position': float(metrics.get('POSITION', 0)),
-                        'device': device.lower()
-                    })
+                    data_rows.append(WebmasterRecord(
+                        date=row_date,
+                        page_path=page_url,
+                        query=query_text,
+                        demand=int(metrics.get('DEMAND', 0)),
+                        impressions=int(float(metrics.get('IMPRESSIONS', 0))),
+                        clicks=int(float(metrics.get('CLICKS', 0))),
+                        position=float(metrics.get('POSITION', 0)),
+                        device=device_value
+                    ))
                 
                 logger.debug(f"Найдено записей: {len(data_rows)}")
                 return data_rows
             else:
                 logger.error(f"Ошибка {response.status_code}: {response.text[:200]}")
+                if raise_errors:
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
                 return []
                 
         except Exception as e:
             logger.error(f"Ошибка: {e}")
+            if raise_errors:
+                raise
             return []
 
-    def save_to_database(self, records: List[Dict[str, Any]]) -> int:
+    def save_to_database(self, records: List[WebmasterRecord]) -> int:
         """Сохраняет записи в базу данных."""
         if not records:
             return 0
         
-        saved_count = 0
-        try:
-            with get_db() as db:
-                for record_data in records:
-                    # Проверяем дубликаты
-                    exists = db.query(WebmasterData).filter(
-                        WebmasterData.date == record_data['date'],
-                        WebmasterData.page_path == record_data['page_path'],
-                        WebmasterData.query == record_data['query'],
-                        WebmasterData.device == record_data['device']
-                    ).first()
-
-                    if not exists:
-                        record = WebmasterData(**record_data)
-                        db.add(record)
-                        saved_count += 1
-                
-                logger.info(f"Сохранено {saved_count} новых записей")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении: {e}")
+        # Коммит каждые BATCH_SIZE строк, битые строки - в rdl.webm_api_dead_letter
+        stats = BatchWriter().write(records)
+        logger.info(f"Сохранено {stats['saved']} новых записей")
+        if stats['quarantined'] or stats['failed_batches']:
+            logger.warning(
+                f"В карантине: {stats['quarantined']}, "
+                f"незаписанных порций: {stats['failed_batches']}"
+            )
         
-        return saved_count
+        return stats['saved']
     
+    def _write_batch(self, batch: List[WebmasterRecord], dedup: RecordDeduplicator,
+                     existing_keys: Optional[ExistingKeySet]) -> int:
+        """Writer stage: attribution, dedup and key filtering run in one thread."""
+        by_url: Dict[str, List[WebmasterRecord]] = {}
+        for record in batch:
+            by_url.setdefault(record.page_path, []).append(record)
+        records = []
+        for page_url, url_records in by_url.items():
+            # TEXT_MATCH ловит и более длинные URL - убираем пересечения и повторы
+            records.extend(dedup.filter(page_url, url_records))
+        if existing_keys is not None:
+            records = existing_keys.filter(records)
+        return self.save_to_database(records)
+
     def load_date(self, target_date: str) -> int:
         """Загружает данные за указанную дату."""
         logger.info(f"Загрузка данных за {target_date}")
@@ -175,23 +201,32 @@ class WebmasterDataLoader:
         if not urls:
             return 0
         
-        # 2. Для каждого URL получаем данные
-        all_records = []
+        # 2. Уже сохраненные ключи отсекаются в писателе (один запрос на дату)
+        existing_keys = None
+        if settings.app.preload_keys:
+            existing_keys = ExistingKeySet.load(datetime.strptime(target_date, '%Y-%m-%d').date())
+        
+        # 3. Запросы URL × устройство идут параллельно (под AIMD-лимитером),
+        # запись - одним писателем порциями. URL одного яруса не содержат
+        # друг друга; ярусы идут по очереди, чтобы строки более длинных URL
+        # были учтены до вычитания из коротких
         device_types = ['DESKTOP', 'MOBILE', 'TABLET']
+        dedup = RecordDeduplicator(settings.app.url_exact_match)
+        bytes_before = self.bytes_downloaded
+        saved = 0
         
-        for i, page_url in enumerate(urls, 1):
-            logger.debug(f"Обработка URL {i}/{len(urls)}: {page_url[:50]}...")
-            
-            for device in device_types:
-                records = self.get_queries_for_url_and_date(target_date, page_url, device)
+        for tier in dedup.url_tiers(urls):
+            pipeline = FetchWritePipeline(
+                fetch=lambda page_url, device: self.get_queries_for_url_and_date(target_date, page_url, device),
+                write=lambda batch: self._write_batch(batch, dedup, existing_keys),
                 # Фильтруем записи с demand > 0
-                filtered_records = [r for r in records if r['demand'] > 0]
-                all_records.extend(filtered_records)
-        
-        # 3. Сохраняем в БД
-        if all_records:
-            saved = self.save_to_database(all_records)
-            logger.info(f"Итого сохранено записей за {target_date}: {saved}")
-            return saved
+                transform=lambda records: [r for r in records if r.demand > 0]
+            )
+            saved += pipeline.run([(page_url, device) for page_url in tier for device in device_types])
         
-        return 0
+        dedup.log_stats(target_date)
+        logger.info(f"Скачано {self.bytes_downloaded - bytes_before} байт за {target_date}")
+        if existing_keys:
+            logger.info(f"Уже в БД: {existing_keys.filtered_out} записей")
+        logger.info(f"Итого сохранено записей за {target_date}: {saved}")
+        return saved
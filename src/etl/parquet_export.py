@@ -0,0 +1,167 @@
+"""Incremental Parquet export of rdl/ppl data partitioned by date."""
+import logging
+import os
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select, text
+
+from config.settings import settings
+from models.database import get_db, WebmasterDataAll
+from models.ppl.models import WebmasterAggregatedAll
+from models.records import RECORD_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow нужен только для экспорта
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Колонки с большим числом повторов - словарное кодирование
+DICTIONARY_COLUMNS = ['page_path', 'query', 'device']
+
+
+def _schema(with_id: bool):
+    fields = [
+        ('date', pa.date32()),
+        ('page_path', pa.string()),
+        ('query', pa.string()),
+        ('demand', pa.int32()),
+        ('impressions', pa.int32()),
+        ('clicks', pa.int32()),
+        ('position', pa.float64()),
+        ('device', pa.string()),
+    ]
+    if with_id:
+        fields.insert(0, ('id', pa.int64()))
+    return pa.schema(fields)
+
+
+class ParquetExporter:
+    """Выгружает WebmasterData и WebmasterAggregated в Parquet по датам.
+
+    Раскладка: <EXPORT_DIR>/<dataset>/date=YYYY-MM-DD/part-0.parquet.
+    Выгружаются даты без файла, а также даты последних
+    max(DAYS_BACK, REFRESH_DAYS) дней, чей отпечаток (число строк + сумма
+    хешей строк) отличается от записанного в метаданных файла: их могли
+    догрузить или пересмотреть через --refresh после выгрузки. Строки
+    читаются серверным курсором порциями по EXPORT_CHUNK_SIZE, так что
+    память не зависит от размера даты.
+    """
+
+    FINGERPRINT_KEY = b'webmaster_fingerprint'
+
+    DATASETS = {
+        # Через представления *_all: архивные даты тоже выгружаются
+        'rdl_webm_api': (WebmasterDataAll, False),
+        'ppl_webmaster_aggregated': (WebmasterAggregatedAll, True),
+    }
+
+    def __init__(self, export_dir: Optional[str] = None, chunk_size: Optional[int] = None):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Parquet export: pip install pyarrow")
+        self.export_dir = Path(export_dir or settings.app.export_dir)
+        self.chunk_size = chunk_size or settings.app.export_chunk_size
+        self.logger = logging.getLogger(__name__)
+
+    def partition_path(self, dataset: str, day: date) -> Path:
+        return self.export_dir / dataset / f"date={day.isoformat()}" / "part-0.parquet"
+
+    def get_exported_dates(self, dataset: str) -> Set[date]:
+        """Dates that already have a finished partition file."""
+        root = self.export_dir / dataset
+        if not root.exists():
+            return set()
+        return {
+            date.fromisoformat(p.parent.name.split('=', 1)[1])
+            for p in root.glob('date=*/part-0.parquet')
+        }
+
+    def get_fingerprints(self, dataset: str, days: Iterable[date]) -> Dict[date, str]:
+        """Row count and summed row hash per date, as stored in exported files."""
+        model, with_id = self.DATASETS[dataset]
+        columns = ', '.join((('id',) if with_id else ()) + RECORD_FIELDS)
+        with get_db() as db:
+            rows = db.execute(text(f"""
+                SELECT date, count(*) || ':' || sum(hashtextextended(ROW({columns})::text, 0))
+                FROM {model.__table__.fullname}
+                WHERE date = ANY(:days)
+                GROUP BY date
+            """), {'days': list(days)})
+            return {row[0]: row[1] for row in rows}
+
+    def read_fingerprint(self, dataset: str, day: date) -> Optional[str]:
+        metadata = pq.read_schema(self.partition_path(dataset, day)).metadata or {}
+        value = metadata.get(self.FINGERPRINT_KEY)
+        return value.decode() if value else None
+
+    def get_pending_dates(self, dataset: str) -> List[date]:
+        model, _ = self.DATASETS[dataset]
+        with get_db() as db:
+            dates = {row[0] for row in db.query(model.date).distinct()}
+        exported = self.get_exported_dates(dataset)
+        pending = dates - exported
+
+        # Недавние даты могли измениться после выгрузки - сверяем отпечатки
+        window = max(settings.app.days_back, settings.app.refresh_days)
+        since = date.today() - timedelta(days=window)
+        recent = [d for d in dates & exported if d >= since]
+        if recent:
+            current = self.get_fingerprints(dataset, recent)
+            pending.update(d for d in recent if current.get(d) != self.read_fingerprint(dataset, d))
+        return sorted(pending)
+
+    def export_date(self, dataset: str, day: date) -> int:
+        """Stream one date into its partition file. Returns row count."""
+        model, with_id = self.DATASETS[dataset]
+        columns = (('id',) if with_id else ()) + RECORD_FIELDS
+        # Отпечаток до чтения: если дата меняется во время выгрузки,
+        # при следующей проверке он не совпадет и дата выгрузится снова
+        fingerprint = self.get_fingerprints(dataset, [day]).get(day, '0:')
+        schema = _schema(with_id).with_metadata({self.FINGERPRINT_KEY: fingerprint.encode()})
+
+        target = self.partition_path(dataset, day)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_suffix('.parquet.tmp')
+
+        statement = (
+            select(*(getattr(model, c) for c in columns))
+            .where(model.date == day)
+            .execution_options(stream_results=True, yield_per=self.chunk_size)
+        )
+
+        rows_written = 0
+        writer = pq.ParquetWriter(
+            tmp_path, schema,
+            compression='zstd',
+            use_dictionary=DICTIONARY_COLUMNS
+        )
+        try:
+            with get_db() as db:
+                for chunk in db.execute(statement).partitions():
+                    arrays = [list(col) for col in zip(*chunk)]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                    rows_written += len(chunk)
+        except Exception:
+            writer.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        writer.close()
+
+        # Файл появляется под финальным именем только целиком
+        os.replace(tmp_path, target)
+        return rows_written
+
+    def export_pending(self) -> int:
+        """Export every new or changed date of every dataset."""
+        total = 0
+        for dataset in self.DATASETS:
+            for day in self.get_pending_dates(dataset):
+                rows = self.export_date(dataset, day)
+                self.logger.info(f"Exported {dataset} {day}: {rows} rows")
+                total += rows
+        return total
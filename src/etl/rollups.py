@@ -0,0 +1,229 @@
+"""Incremental weekly/monthly rollups over ppl.webmaster_aggregated."""
+import logging
+from datetime import date, timedelta
+from typing import Iterable, List, Dict, Any, Optional, Set
+
+from sqlalchemy import text
+
+from models.database import get_db
+
+logger = logging.getLogger(__name__)
+
+GRAINS = ('month', 'week')  # от крупного к мелкому
+
+# dimension -> (rollup table, колонка измерения)
+DIMENSIONS = {
+    'page': ('ppl.webmaster_rollup_page', 'page_path'),
+    'query': ('ppl.webmaster_rollup_query', 'query'),
+}
+
+
+def period_start(day: date, grain: str) -> date:
+    """Start of the week (Monday) or month containing day."""
+    if grain == 'month':
+        return day.replace(day=1)
+    return day - timedelta(days=day.weekday())
+
+
+def period_end(start: date, grain: str) -> date:
+    """Last day of the period starting at start."""
+    if grain == 'month':
+        next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return next_month - timedelta(days=1)
+    return start + timedelta(days=6)
+
+
+def periods_between(start: date, end: date, grain: str) -> List[date]:
+    """Starts of all periods of the grain that intersect [start, end]."""
+    periods = []
+    current = period_start(start, grain)
+    while current <= end:
+        periods.append(current)
+        current = period_end(current, grain) + timedelta(days=1)
+    return periods
+
+
+def covering_grain(start: date, end: date) -> Optional[str]:
+    """Coarsest grain whose whole periods exactly tile [start, end]."""
+    for grain in GRAINS:
+        if period_start(start, grain) == start and period_end(period_start(end, grain), grain) == end:
+            return grain
+    return None
+
+
+class RollupManager:
+    """Поддерживает сводные таблицы и отвечает на запросы дашбордов.
+
+    После каждого прогона ETL пересчитываются только периоды (неделя/месяц),
+    в которые попали обработанные даты. Позиция хранится как
+    sum(position * impressions), чтобы средневзвешенная позиция корректно
+    суммировалась между периодами.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def refresh(self, dates: Iterable[date]) -> int:
+        """Rebuild rollup rows for every period touched by dates."""
+        dates = set(dates)
+        if not dates:
+            return 0
+
+        total = 0
+        with get_db() as db:
+            for grain in GRAINS:
+                periods: Set[date] = {period_start(d, grain) for d in dates}
+                for table, column in DIMENSIONS.values():
+                    total += self._rebuild(db, table, column, grain, sorted(periods))
+                # Период отмечается построенным, даже если данных в нем нет
+                db.execute(text("""
+                    INSERT INTO ppl.webmaster_rollup_periods (grain, period_start)
+                    SELECT :grain, unnest(CAST(:periods AS date[]))
+                    ON CONFLICT (grain, period_start) DO UPDATE SET built_at = now()
+                """), {'grain': grain, 'periods': sorted(periods)})
+
+        self.logger.info(f"Rollups refreshed for {len(dates)} dates: {total} rows")
+        return total
+
+    def rebuild_all(self) -> int:
+        """Build rollups for the whole ppl history, one month per transaction.
+
+        Нужен после развертывания (и после ручных правок ppl): refresh()
+        пересчитывает только периоды, затронутые очередным ETL.
+        """
+        with get_db() as db:
+            first, last = db.execute(text(
+                "SELECT min(date), max(date) FROM ppl.webmaster_aggregated_all"
+            )).one()
+        if first is None:
+            return 0
+
+        total = 0
+        for month in periods_between(first, last, 'month'):
+            days = (period_end(month, 'month') - month).days + 1
+            total += self.refresh(month + timedelta(days=i) for i in range(days))
+        self.logger.info(f"Rollups rebuilt for {first}..{last}: {total} rows")
+        return total
+
+    def is_built(self, grain: str, start: date, end: date) -> bool:
+        """True when every grain period intersecting [start, end] has been built."""
+        expected = periods_between(start, end, grain)
+        with get_db() as db:
+            built = db.execute(text("""
+                SELECT count(*) FROM ppl.webmaster_rollup_periods
+                WHERE grain = :grain AND period_start BETWEEN :date_from AND :date_to
+            """), {'grain': grain, 'date_from': expected[0], 'date_to': expected[-1]}).scalar()
+        return built == len(expected)
+
+    def _rebuild(self, db, table: str, column: str, grain: str, periods: List[date]) -> int:
+        params = {
+            'grain': grain,
+            'periods': periods,
+            'date_from': periods[0],
+            'date_to': period_end(periods[-1], grain),
+        }
+        db.execute(
+            text(f"DELETE FROM {table} WHERE grain = :grain AND period_start = ANY(:periods)"),
+            params
+        )
+        result = db.execute(text(f"""
+            INSERT INTO {table}
+                (grain, period_start, {column}, device, impressions, clicks, position_sum)
+            SELECT :grain, date_trunc(:grain, date::timestamp)::date AS period, {column}, device,
+                   sum(impressions), sum(clicks), sum(position * impressions)
+            FROM ppl.webmaster_aggregated_all  -- с архивом: период пересчитывается целиком
+            WHERE date BETWEEN :date_from AND :date_to
+              AND date_trunc(:grain, date::timestamp)::date = ANY(:periods)
+            GROUP BY period, {column}, device
+        """), params)
+        return result.rowcount
+
+    def get_stats(self, dimension: str, start: date, end: date,
+                  value: Optional[str] = None, device: Optional[str] = None,
+                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Clicks, impressions and weighted position per page/query and device.
+
+        Берется самая крупная сводка, периоды которой целиком покрывают
+        [start, end]; если таких нет или не все периоды еще построены -
+        считается по дневным строкам ppl.
+        """
+        table, column = DIMENSIONS[dimension]
+        grain = covering_grain(start, end)
+        if grain and not self.is_built(grain, start, end):
+            self.logger.info(f"Rollup {grain} not built for {start}..{end}, using daily rows")
+            grain = None
+
+        filters = []
+        params: Dict[str, Any] = {'date_from': start, 'date_to': end, 'limit': limit}
+        if value is not None:
+            filters.append(f"{column} = :value")
+            params['value'] = value
+        if device is not None:
+            filters.append("device = :device")
+            params['device'] = device
+
+        if grain:
+            source = table
+            filters.append("grain = :grain AND period_start BETWEEN :date_from AND :date_to")
+            params['grain'] = grain
+            position_sum = "sum(position_sum)"
+        else:
+            source = 'ppl.webmaster_aggregated_all'
+            filters.append("date BETWEEN :date_from AND :date_to")
+            position_sum = "sum(position * impressions)"
+
+        sql = f"""
+            SELECT {column}, device, sum(clicks) AS clicks, sum(impressions) AS impressions,
+                   {position_sum} / NULLIF(sum(impressions), 0) AS position
+            FROM {source}
+            WHERE {' AND '.join(filters)}
+            GROUP BY {column}, device
+            ORDER BY clicks DESC
+        """
+        if limit:
+            sql += " LIMIT :limit"
+
+        self.logger.debug(f"Rollup query {dimension} {start}..{end} via {grain or 'daily rows'}")
+        with get_db() as db:
+            return [dict(row._mapping) for row in db.execute(text(sql), params)]
+
+    def get_series(self, dimension: str, grain: str, start: date, end: date,
+                   value: Optional[str] = None, device: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per-period (week/month) series from the rollup table.
+
+        Пока не все периоды построены, ряд считается по дневным строкам ppl.
+        """
+        table, column = DIMENSIONS[dimension]
+
+        if self.is_built(grain, start, end):
+            filters = ["grain = :grain", "period_start BETWEEN :date_from AND :date_to"]
+            period_column = "period_start"
+            position_sum = "sum(position_sum)"
+        else:
+            table = 'ppl.webmaster_aggregated_all'
+            filters = ["date BETWEEN :date_from AND :date_to"]
+            period_column = "date_trunc(:grain, date::timestamp)::date"
+            position_sum = "sum(position * impressions)"
+        params: Dict[str, Any] = {
+            'grain': grain,
+            'date_from': period_start(start, grain),
+            'date_to': end,
+        }
+        if value is not None:
+            filters.append(f"{column} = :value")
+            params['value'] = value
+        if device is not None:
+            filters.append("device = :device")
+            params['device'] = device
+
+        sql = f"""
+            SELECT {period_column} AS period_start, sum(clicks) AS clicks,
+                   sum(impressions) AS impressions,
+                   {position_sum} / NULLIF(sum(impressions), 0) AS position
+            FROM {table}
+            WHERE {' AND '.join(filters)}
+            GROUP BY 1
+            ORDER BY 1
+        """
+        with get_db() as db:
+            return [dict(row._mapping) for row in db.execute(text(sql), params)]
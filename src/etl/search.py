@@ -0,0 +1,118 @@
+"""Substring search over collected queries (pg_trgm GIN indexes)."""
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from models.database import get_db
+
+logger = logging.getLogger(__name__)
+
+ORDER_COLUMNS = ('clicks', 'impressions')
+SEARCH_FIELDS = ('query', 'page_path')
+MAX_PAGE_SIZE = 1000
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so the substring is matched literally."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class QuerySearch:
+    """Поиск запросов по подстроке за период с сортировкой по кликам/показам.
+
+    ILIKE '%...%' по ppl.webmaster_aggregated_all (горячие + архивные строки)
+    отрабатывает по триграммным GIN-индексам обеих таблиц вместо полного
+    скана. Подстроки короче 3 символов триграммы почти не сужают -
+    такие запросы медленные.
+    """
+
+    def __init__(self, source: str = 'ppl.webmaster_aggregated_all'):
+        self.source = source
+        self.logger = logging.getLogger(__name__)
+
+    def _filters(self, substring: str, start: date, end: date,
+                 field: str, device: Optional[str]) -> Tuple[List[str], Dict[str, Any]]:
+        if field not in SEARCH_FIELDS:
+            raise ValueError(f"field must be one of {SEARCH_FIELDS}")
+        filters = [
+            f"{field} ILIKE :pattern ESCAPE '\\'",
+            "date BETWEEN :date_from AND :date_to",
+        ]
+        params: Dict[str, Any] = {
+            'pattern': f"%{escape_like(substring)}%",
+            'date_from': start,
+            'date_to': end,
+        }
+        if device is not None:
+            filters.append("device = :device")
+            params['device'] = device
+        return filters, params
+
+    def build_search(self, substring: str, start: date, end: date,
+                     order_by: str = 'clicks', field: str = 'query',
+                     device: Optional[str] = None, page: int = 1,
+                     page_size: int = 50, with_total: bool = True) -> Tuple[str, Dict[str, Any]]:
+        """SQL and bind parameters for one search() page."""
+        if order_by not in ORDER_COLUMNS:
+            raise ValueError(f"order_by must be one of {ORDER_COLUMNS}")
+        if not substring:
+            raise ValueError("substring must not be empty")
+
+        filters, params = self._filters(substring, start, end, field, device)
+        params.update(limit=page_size, offset=(page - 1) * page_size)
+
+        total_column = ", count(*) OVER () AS total" if with_total else ""
+        sql = f"""
+            SELECT query, sum(clicks) AS clicks, sum(impressions) AS impressions,
+                   sum(position * impressions) / NULLIF(sum(impressions), 0) AS position
+                   {total_column}
+            FROM {self.source}
+            WHERE {' AND '.join(filters)}
+            GROUP BY query
+            ORDER BY {order_by} DESC, query
+            LIMIT :limit OFFSET :offset
+        """
+        return sql, params
+
+    def search(self, substring: str, start: date, end: date,
+               order_by: str = 'clicks', field: str = 'query',
+               device: Optional[str] = None, page: int = 1,
+               page_size: int = 50, with_total: bool = True) -> Dict[str, Any]:
+        """Top queries whose field contains substring, summed over [start, end].
+
+        Возвращает {'items': [...], 'page', 'page_size', 'total'}; каждый
+        элемент - query, clicks, impressions, position (взвешенная по
+        показам). total - число найденных запросов (None при with_total=False).
+        """
+        page = max(page, 1)
+        page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+        if len(substring) < 3:
+            self.logger.warning(f"Substring '{substring}' is shorter than a trigram, search will be slow")
+
+        sql, params = self.build_search(
+            substring, start, end, order_by, field, device, page, page_size, with_total
+        )
+        with get_db() as db:
+            rows = [dict(row._mapping) for row in db.execute(text(sql), params)]
+
+        total = None
+        if with_total:
+            total = rows[0]['total'] if rows else 0
+            for row in rows:
+                row.pop('total')
+            if not rows and page > 1:
+                # За последней страницей оконная функция ничего не вернет
+                total = self.count(substring, start, end, field, device)
+
+        return {'items': rows, 'page': page, 'page_size': page_size, 'total': total}
+
+    def count(self, substring: str, start: date, end: date,
+              field: str = 'query', device: Optional[str] = None) -> int:
+        """Number of distinct queries matching the substring in the period."""
+        filters, params = self._filters(substring, start, end, field, device)
+        with get_db() as db:
+            return db.execute(text(
+                f"SELECT count(DISTINCT query) FROM {self.source} WHERE {' AND '.join(filters)}"
+            ), params).scalar()
@@ -0,0 +1,150 @@
+"""Hot/cold storage tiering: move old dates out of the hot rdl/ppl tables."""
+import logging
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from config.settings import settings
+from models.database import engine, get_db, create_cold_storage, COLD_TABLES
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ('date', 'page_path', 'query', 'device')
+
+# Строки ppl, на которые ссылаются positions/clicks, остаются в горячей таблице
+KEEP_HOT = {
+    'ppl.webmaster_aggregated': (
+        "NOT EXISTS (SELECT 1 FROM ppl.webmaster_positions p WHERE p.id = h.id) "
+        "AND NOT EXISTS (SELECT 1 FROM ppl.webmaster_clicks c WHERE c.id = h.id)"
+    ),
+}
+
+
+class StorageTiering:
+    """Переносит даты старше ARCHIVE_AFTER_DAYS в холодные таблицы *_cold.
+
+    Горячие таблицы (rdl.webm_api, ppl.webmaster_aggregated) остаются
+    маленькими: их индексы, VACUUM и ON CONFLICT работают только по
+    свежим датам. Холодные таблицы без индекса по ключу (BRIN по date),
+    полная история читается через представления *_all
+    (модели WebmasterDataAll / WebmasterAggregatedAll).
+
+    Холодные таблицы не сжаты: сжатие PostgreSQL действует только на
+    TOAST-значения (от ~2 КБ), а строки запросов и URL короче. Экономия
+    идет за счет индексов, сжатая копия истории - Parquet-экспорт.
+
+    Перенос идет по одной дате в транзакции и идемпотентен: если дату
+    повторно загрузили после архивации, новые строки заменяют холодные.
+    """
+
+    def __init__(self, archive_after_days: Optional[int] = None):
+        self.archive_after_days = (
+            settings.app.archive_after_days if archive_after_days is None else archive_after_days
+        )
+        # Обновляемые окна (DAYS_BACK, --refresh) должны оставаться горячими:
+        # upsert проверяет конфликты только в горячей таблице
+        min_days = max(settings.app.days_back, settings.app.refresh_days)
+        if self.archive_after_days and self.archive_after_days <= min_days:
+            raise ValueError(
+                f"ARCHIVE_AFTER_DAYS={self.archive_after_days} must exceed "
+                f"DAYS_BACK/REFRESH_DAYS ({min_days})"
+            )
+
+    def get_cutoff(self) -> date:
+        return date.today() - timedelta(days=self.archive_after_days)
+
+    def get_dates_to_archive(self, hot: str, cutoff: date) -> List[date]:
+        with get_db() as db:
+            rows = db.execute(
+                text(f"SELECT DISTINCT date FROM {hot} WHERE date < :cutoff ORDER BY date"),
+                {'cutoff': cutoff}
+            )
+            return [row[0] for row in rows]
+
+    def archive_date(self, hot: str, day: date) -> int:
+        """Move one date from hot to cold in a single transaction. Returns rows moved."""
+        cold, _ = COLD_TABLES[hot]
+        key_match = ' AND '.join(f"c.{col} = h.{col}" for col in KEY_COLUMNS)
+        keep_hot = KEEP_HOT.get(hot)
+        condition = "h.date = :day" + (f" AND {keep_hot}" if keep_hot else "")
+
+        with get_db() as db:
+            # Повторно загруженные ключи: в архиве остается свежая версия
+            db.execute(text(
+                f"DELETE FROM {cold} c USING {hot} h WHERE c.date = :day AND {condition} AND {key_match}"
+            ), {'day': day})
+            result = db.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {hot} h WHERE {condition} RETURNING h.*
+                )
+                INSERT INTO {cold} SELECT * FROM moved
+            """), {'day': day})
+            return result.rowcount
+
+    def measure(self, table: str) -> Dict[str, float]:
+        """Table/index size and the time of a plain VACUUM (ANALYZE) of the table."""
+        with get_db() as db:
+            sizes = db.execute(text(
+                "SELECT pg_table_size(c.oid), pg_indexes_size(c.oid), c.reltuples::bigint "
+                "FROM pg_class c WHERE c.oid = CAST(:t AS regclass)"
+            ), {'t': table}).one()
+
+        started = time.perf_counter()
+        # VACUUM нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+        return {
+            'rows': sizes[2],
+            'table_bytes': sizes[0],
+            'index_bytes': sizes[1],
+            'vacuum_seconds': round(time.perf_counter() - started, 3),
+        }
+
+    def _compact(self, table: str):
+        """Reclaim space after the move: B-tree pages are not returned by VACUUM alone."""
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f"VACUUM {table}"))
+            conn.execute(text(f"REINDEX TABLE CONCURRENTLY {table}"))
+
+    def archive(self, measure: bool = False) -> Dict[str, Dict]:
+        """Archive every hot table; returns per-table dates and rows moved.
+
+        measure=True дополнительно замеряет размер и VACUUM до и после
+        переноса и сжимает горячую таблицу (VACUUM + REINDEX CONCURRENTLY,
+        включая триграммные GIN-индексы) - это долго, поэтому по запросу.
+        """
+        if not self.archive_after_days:
+            logger.info("Archiving disabled (ARCHIVE_AFTER_DAYS=0)")
+            return {}
+
+        create_cold_storage()
+        cutoff = self.get_cutoff()
+        report = {}
+
+        for hot in COLD_TABLES:
+            dates = self.get_dates_to_archive(hot, cutoff)
+            if not dates:
+                logger.info(f"{hot}: nothing older than {cutoff}")
+                continue
+
+            before = self.measure(hot) if measure else None
+            moved = 0
+            for day in dates:
+                moved += self.archive_date(hot, day)
+
+            report[hot] = {'dates': len(dates), 'moved': moved}
+            logger.info(f"{hot}: {len(dates)} dates / {moved} rows -> {COLD_TABLES[hot][0]}")
+            if not measure:
+                continue
+
+            self._compact(hot)
+            after = self.measure(hot)
+            report[hot].update(before=before, after=after)
+            logger.info(
+                f"{hot}: indexes {before['index_bytes'] / 2 ** 20:.1f} -> {after['index_bytes'] / 2 ** 20:.1f} MiB, "
+                f"table {before['table_bytes'] / 2 ** 20:.1f} -> {after['table_bytes'] / 2 ** 20:.1f} MiB, "
+                f"vacuum {before['vacuum_seconds']:.2f} -> {after['vacuum_seconds']:.2f}s"
+            )
+        return report
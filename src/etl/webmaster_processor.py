@@ -1,13 +1,17 @@
 """ETL processor for Webmaster data (rdl -> ppl)."""
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional, Iterator
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
-from models.database import get_db
+from sqlalchemy import select, and_, func
+from config.settings import settings
+from models.database import get_db, copy_records, copy_to_staging, metrics_hash
 from models.database import WebmasterData  # rdl слой
-from models.ppl.models import WebmasterAggregated  # ppl слой
+from models.ppl.models import WebmasterAggregatedAll  # ppl слой (горячие + архивные строки)
+from models.records import WebmasterRecord, RECORD_FIELDS
+from etl.rollups import RollupManager
 
 logger = logging.getLogger(__name__)
 
@@ -17,47 +21,41 @@ class WebmasterETLProcessor:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.last_error: Optional[str] = None  # ошибка последнего прогона (для health)
     
     def get_last_processed_id(self) -> int:
         """Get last processed ID from ppl layer."""
         try:
             with get_db() as db:
-                last_id = db.query(WebmasterAggregated.id).order_by(WebmasterAggregated.id.desc()).first()
-                return last_id[0] if last_id else 0
+                # С учетом архива: id не должны повторяться после переноса
+                last_id = db.query(func.max(WebmasterAggregatedAll.id)).scalar()
+                return last_id or 0
         except Exception as e:
             self.logger.error(f"Error getting last ID: {e}")
             return 0
     
-    def get_new_rdl_data(self, last_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    def get_new_rdl_data(self, last_date: Optional[datetime] = None) -> List[WebmasterRecord]:
         """Get new data from rdl layer."""
         try:
             with get_db() as db:
-                query = db.query(WebmasterData)
+                # Column-only select: строки приходят кортежами, без ORM-объектов
+                query = db.query(*(getattr(WebmasterData, f) for f in RECORD_FIELDS))
                 
                 if last_date:
                     query = query.filter(WebmasterData.date > last_date)
                 
-                # Get data that doesn't exist in ppl layer
+                # Get data that doesn't exist in ppl layer (hot or archived)
                 results = []
                 for row in query.all():
-                    exists = db.query(WebmasterAggregated).filter(
-                        WebmasterAggregated.date == row.date,
-                        WebmasterAggregated.query == row.query,
-                        WebmasterAggregated.page_path == row.page_path,
-                        WebmasterAggregated.device == row.device
+                    exists = db.query(WebmasterAggregatedAll.id).filter(
+                        WebmasterAggregatedAll.date == row.date,
+                        WebmasterAggregatedAll.query == row.query,
+                        WebmasterAggregatedAll.page_path == row.page_path,
+                        WebmasterAggregatedAll.device == row.device
                     ).first()
                     
                     if not exists:
-                        results.append({
-                            'date': row.date,
-                            'page_path': row.page_path,
-                            'query': row.query,
-                            'demand': row.demand,
-                            'impressions': row.impressions,
-                            'clicks': row.clicks,
-                            'position': row.position,
-                            'device': row.device
-                        })
+                        results.append(WebmasterRecord(*row))
                 
                 self.logger.info(f"Found {len(results)} new rows in rdl layer")
                 return results
@@ -66,16 +64,54 @@ class WebmasterETLProcessor:
             self.logger.error(f"Error getting rdl data: {e}")
             return []
     
-    def apply_business_logic(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _not_in_ppl(self):
+        """rdl rows without a matching ppl row, hot or archived (NOT EXISTS filter).
+
+        Перезагруженная архивная дата снова попадает в горячий rdl, а ее
+        строки ppl лежат в холодной таблице - их тоже надо учитывать.
+        """
+        already_in_ppl = select(WebmasterAggregatedAll.id).where(and_(
+            WebmasterAggregatedAll.date == WebmasterData.date,
+            WebmasterAggregatedAll.query == WebmasterData.query,
+            WebmasterAggregatedAll.page_path == WebmasterData.page_path,
+            WebmasterAggregatedAll.device == WebmasterData.device
+        )).exists()
+        return ~already_in_ppl
+    
+    def has_pending_rows(self) -> bool:
+        """True when rdl has rows not yet in ppl (e.g. left by a failed run)."""
+        with get_db() as db:
+            return db.execute(
+                select(select(WebmasterData.date).where(self._not_in_ppl()).exists())
+            ).scalar()
+    
+    def iter_new_rdl_chunks(self, last_date: Optional[datetime] = None,
+                            chunk_size: Optional[int] = None) -> Iterator[List[WebmasterRecord]]:
+        """Stream new rdl rows in fixed-size chunks via a server-side cursor.
+        
+        Rows already present in ppl are excluded with NOT EXISTS on the
+        server, so only the columns of new rows cross the wire.
+        """
+        chunk_size = chunk_size or settings.app.etl_chunk_size
+        statement = select(*(getattr(WebmasterData, f) for f in RECORD_FIELDS)).where(self._not_in_ppl())
+        if last_date:
+            statement = statement.where(WebmasterData.date > last_date)
+        statement = statement.execution_options(stream_results=True, yield_per=chunk_size)
+        
+        with get_db() as db:
+            for chunk in db.execute(statement).partitions():
+                yield [WebmasterRecord(*row) for row in chunk]
+    
+    def apply_business_logic(self, data: List[WebmasterRecord]) -> List[WebmasterRecord]:
         """Apply business logic to raw data."""
         processed_data = []
         
         for row in data:
             # Ensure numeric types
-            demand = int(row.get('demand', 0))
-            impressions = int(row.get('impressions', 0))
-            clicks = int(row.get('clicks', 0))
-            position = float(row.get('position', 0.0))
+            demand = int(row.demand or 0)
+            impressions = int(row.impressions or 0)
+            clicks = int(row.clicks or 0)
+            position = float(row.position or 0.0)
             
             # Apply business rules
             # 1. demand should be >= impressions
@@ -86,24 +122,24 @@ class WebmasterETLProcessor:
             if clicks > impressions:
                 clicks = impressions
             
-            processed_row = {
-                'date': row['date'],
-                'page_path': row['page_path'],
-                'query': row['query'],
-                'device': row['device'],
-                'demand': demand,
-                'impressions': impressions,
-                'clicks': clicks,
-                'position': position
-            }
+            processed_row = row._replace(
+                demand=demand,
+                impressions=impressions,
+                clicks=clicks,
+                position=position
+            )
             
             processed_data.append(processed_row)
         
         self.logger.info(f"Applied business logic to {len(processed_data)} rows")
         return processed_data
     
-    def save_to_ppl(self, data: List[Dict[str, Any]]) -> int:
-        """Save processed data to ppl layer."""
+    def save_to_ppl(self, data: List[WebmasterRecord], raise_errors: bool = False) -> int:
+        """Save processed data to ppl layer.
+
+        raise_errors=True пробрасывает ошибку вместо возврата 0, чтобы
+        вызывающий мог отличить сбой от "нечего сохранять".
+        """
         if not data:
             return 0
         
@@ -113,43 +149,150 @@ class WebmasterETLProcessor:
                 last_id = self.get_last_processed_id()
                 next_id = last_id + 1
                 
-                saved_count = 0
-                for i, row in enumerate(data, 1):
-                    ppl_row = WebmasterAggregated(
-                        id=next_id + i - 1,
-                        date=row['date'],
-                        query=row['query'],
-                        page_path=row['page_path'],
-                        device=row['device'],
-                        demand=row['demand'],
-                        impressions=row['impressions'],
-                        clicks=row['clicks'],
-                        position=row['position']
-                    )
-                    
-                    db.add(ppl_row)
-                    saved_count += 1
+                # id + поля записи идут в COPY одним кортежем
+                rows = ((next_id + i, *row) for i, row in enumerate(data))
+                saved_count = copy_records(
+                    db, rows,
+                    table='ppl.webmaster_aggregated',
+                    columns=('id',) + RECORD_FIELDS
+                )
                 
                 self.logger.info(f"Saved {saved_count} rows to ppl layer")
                 return saved_count
                 
         except Exception as e:
             self.logger.error(f"Error saving to ppl: {e}")
+            if raise_errors:
+                raise
+            return 0
+    
+    def propagate_changes(self, records: List[WebmasterRecord], db=None) -> Dict[str, int]:
+        """Push inserted/updated rdl rows into ppl layer incrementally.
+
+        Existing ppl rows with the same (date, page_path, query, device) are
+        updated only when metrics differ; unknown keys get new ids.
+
+        С db изменения пишутся в транзакции вызывающего (вместе с upsert
+        в rdl), ошибки пробрасываются, а сводки обновляет вызывающий после
+        коммита. Без db - своя транзакция, ошибка логируется.
+        """
+        if not records:
+            return {'inserted': 0, 'updated': 0}
+        
+        if db is not None:
+            return self._propagate(db, records)
+        
+        try:
+            with get_db() as own_db:
+                stats = self._propagate(own_db, records)
+            self.refresh_rollups(row.date for row in records)
+            return stats
+            
+        except Exception as e:
+            self.logger.error(f"Error propagating changes to ppl: {e}")
+            return {'inserted': 0, 'updated': 0}
+    
+    def _propagate(self, db, records: List[WebmasterRecord]) -> Dict[str, int]:
+        processed_data = self.apply_business_logic(records)
+        key_match = ' AND '.join(
+            f"a.{f} = s.{f}" for f in ('date', 'page_path', 'query', 'device')
+        )
+        column_list = ', '.join(RECORD_FIELDS)
+        
+        next_id = self.get_last_processed_id() + 1
+        cursor = db.connection().connection.cursor()
+        try:
+            staging, _ = copy_to_staging(cursor, processed_data)
+            
+            cursor.execute(
+                f"UPDATE ppl.webmaster_aggregated a SET "
+                f"demand = s.demand, impressions = s.impressions, "
+                f"clicks = s.clicks, position = s.position "
+                f"FROM {staging} s WHERE {key_match} "
+                f"AND {metrics_hash('a')} IS DISTINCT FROM {metrics_hash('s')}"
+            )
+            updated = cursor.rowcount
+            
+            cursor.execute(
+                f"INSERT INTO ppl.webmaster_aggregated (id, {column_list}) "
+                f"SELECT %s + row_number() OVER () - 1, "
+                f"{', '.join('s.' + f for f in RECORD_FIELDS)} FROM {staging} s "
+                f"WHERE NOT EXISTS (SELECT 1 FROM ppl.webmaster_aggregated a "
+                f"WHERE {key_match})",
+                (next_id,)
+            )
+            inserted = cursor.rowcount
+        finally:
+            cursor.close()
+        
+        self.logger.info(f"Propagated to ppl: {inserted} inserted, {updated} updated")
+        return {'inserted': inserted, 'updated': updated}
+    
+    def refresh_rollups(self, dates) -> int:
+        """Rebuild rollup periods containing the given dates."""
+        try:
+            return RollupManager().refresh(dates)
+        except Exception as e:
+            self.logger.error(f"Error refreshing rollups: {e}")
+            return 0
+    
+    def get_last_processed_date(self):
+        """Date of the last row written to ppl layer (by id)."""
+        last_id = self.get_last_processed_id()
+        if last_id > 0:
+            with get_db() as db:
+                last_row = db.query(WebmasterAggregatedAll.date).filter_by(id=last_id).first()
+                if last_row:
+                    return last_row.date
+        return None
+    
+    def run_etl_streaming(self, chunk_size: Optional[int] = None) -> int:
+        """Run ETL chunk by chunk: peak memory is bounded by chunk_size.
+
+        Фильтра по последней обработанной дате нет: чанки коммитятся по
+        отдельности, и после сбоя одного чанка следующие записали бы более
+        поздние даты - строки упавшего чанка отсеклись бы навсегда. Новые
+        строки выбирает только NOT EXISTS по ppl, а прогон останавливается
+        на первом упавшем чанке; его строки возьмет следующий запуск.
+        """
+        self.logger.info("Starting Webmaster ETL process (streaming)...")
+        self.last_error = None
+        
+        saved_count = 0
+        touched_dates = set()
+        try:
+            for chunk in self.iter_new_rdl_chunks(None, chunk_size):
+                processed_chunk = self.apply_business_logic(chunk)
+                saved = self.save_to_ppl(processed_chunk, raise_errors=True)
+                if saved:
+                    touched_dates.update(row.date for row in processed_chunk)
+                saved_count += saved
+        except Exception as e:
+            self.logger.error(f"ETL stopped after {saved_count} rows, remaining rows wait for the next run: {e}")
+            self.last_error = str(e)[:500]
+            self.refresh_rollups(touched_dates)
+            return saved_count
+        
+        if not saved_count:
+            self.logger.info("No new data to process")
             return 0
+        
+        self.refresh_rollups(touched_dates)
+        
+        self.logger.info(f"ETL completed: {saved_count} rows processed")
+        return saved_count
     
-    def run_etl(self) -> int:
+    def run_etl(self, streaming: bool = False) -> int:
         """Run complete ETL process."""
+        if streaming:
+            return self.run_etl_streaming()
+        
         self.logger.info("Starting Webmaster ETL process...")
+        self.last_error = None
         
         try:
             # 1. Get last processed date
-            last_date = None
-            last_id = self.get_last_processed_id()
-            if last_id > 0:
-                with get_db() as db:
-                    last_row = db.query(WebmasterAggregated).filter_by(id=last_id).first()
-                    if last_row:
-                        last_date = last_row.date
+            last_date = self.get_last_processed_date()
             
             # 2. Get new data from rdl
             new_data = self.get_new_rdl_data(last_date)
@@ -162,11 +305,16 @@ class WebmasterETLProcessor:
             processed_data = self.apply_business_logic(new_data)
             
             # 4. Save to ppl
-            saved_count = self.save_to_ppl(processed_data)
+            saved_count = self.save_to_ppl(processed_data, raise_errors=True)
+            
+            # 5. Refresh week/month rollups for touched periods
+            if saved_count:
+                self.refresh_rollups(row.date for row in processed_data)
             
             self.logger.info(f"ETL completed: {saved_count} rows processed")
             return saved_count
             
         except Exception as e:
             self.logger.error(f"ETL failed: {e}")
+            self.last_error = str(e)[:500]
             return 0
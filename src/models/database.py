@@ -1,16 +1,21 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, Text
+from sqlalchemy import create_engine, Column, Integer, String, Date, Float, Text, DateTime, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
-from typing import Generator
-from sqlalchemy import PrimaryKeyConstraint
+from typing import Generator, Iterable, Sequence, Tuple, Dict, List
+from sqlalchemy import PrimaryKeyConstraint, UniqueConstraint, Index, text
+import csv
+import io
 
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from config.settings import settings
+from models.records import WebmasterRecord, RECORD_FIELDS
 
 Base = declarative_base()
+# Модели поверх представлений: не создаются через create_all
+ViewBase = declarative_base()
 
 class WebmasterData(Base):
     """Модель для данных Яндекс.Вебмастер - соответствует таблице rdl.webm_api"""
@@ -32,6 +37,83 @@ class WebmasterData(Base):
     def __repr__(self):
         return f"<WebmasterData(date={self.date}, query={self.query[:30]}..., device={self.device})>"
 
+
+class WebmasterDeadLetter(Base):
+    """Строки, которые не удалось записать в rdl.webm_api (карантин)."""
+    __tablename__ = 'webm_api_dead_letter'
+    __table_args__ = {'schema': 'rdl'}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    date = Column(Date, nullable=True)
+    payload = Column(Text, nullable=False)  # JSON исходной записи
+    error = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<WebmasterDeadLetter(id={self.id}, date={self.date}, error={self.error[:30]}...)>"
+
+
+class WebmasterFetchJob(Base):
+    """Задача скачивания (date × URL × device) для распределенных воркеров."""
+    __tablename__ = 'webm_fetch_jobs'
+    __table_args__ = (
+        UniqueConstraint('date', 'page_url', 'device'),
+        Index('ix_webm_fetch_jobs_claim', 'status', 'lease_until'),
+        # Порядок выдачи и проверка ярусов по незавершенным задачам (JobQueue.claim)
+        Index('ix_webm_fetch_jobs_tier', 'date', 'depth', 'id', postgresql_where=text("status <> 'done'")),
+        {'schema': 'rdl'}
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    date = Column(Date, nullable=False)
+    page_url = Column(Text, nullable=False)
+    device = Column(String(20), nullable=False)
+    depth = Column(Integer, nullable=False, default=0, server_default='0')  # ярус вложенности URL (core.dedup)
+    status = Column(String(10), nullable=False, default='pending')  # pending | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(100), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    rows = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<WebmasterFetchJob(id={self.id}, date={self.date}, device={self.device}, status={self.status})>"
+
+
+class WebmasterRunMetrics(Base):
+    """Фактические затраты на сбор одной даты (для планировщика бэкфилла)."""
+    __tablename__ = 'webm_run_metrics'
+    __table_args__ = {'schema': 'rdl'}
+
+    date = Column(Date, primary_key=True)
+    urls = Column(Integer, nullable=False)
+    requests = Column(Integer, nullable=False)
+    rows = Column(Integer, nullable=False)
+    bytes = Column(Integer, nullable=False)
+    seconds = Column(Float, nullable=False)
+    collected_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<WebmasterRunMetrics(date={self.date}, urls={self.urls}, requests={self.requests})>"
+
+class WebmasterDataAll(ViewBase):
+    """Read-only: горячие + архивные строки rdl (представление rdl.webm_api_all)"""
+    __tablename__ = 'webm_api_all'
+    __table_args__ = (
+        PrimaryKeyConstraint('date', 'page_path', 'query', 'device'),
+        {'schema': 'rdl'}
+    )
+
+    date = Column(Date, nullable=False)
+    page_path = Column(Text, nullable=False)
+    query = Column(Text, nullable=False)
+    demand = Column(Integer, nullable=False)
+    impressions = Column(Integer, nullable=False)
+    clicks = Column(Integer, nullable=False)
+    position = Column(Float, nullable=False)
+    device = Column(String(20), nullable=False)
+
 # Создаем движок базы данных
 engine = create_engine(
     settings.db.connection_string,
@@ -56,14 +138,231 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+# Текстовые NOT NULL колонки: пустая строка в CSV не должна читаться как NULL
+NOT_NULL_TEXT_COLUMNS = ('page_path', 'query', 'device')
+
+
+def copy_options(columns: Sequence[str]) -> str:
+    """COPY ... WITH (...) options for csv.writer output.
+
+    csv.writer пишет '' без кавычек, а COPY CSV читает такое поле как NULL;
+    FORCE_NOT_NULL сохраняет пустые query/page_path пустыми строками,
+    как это делал ORM-путь.
+    """
+    force = [c for c in columns if c in NOT_NULL_TEXT_COLUMNS]
+    options = "FORMAT csv"
+    if force:
+        options += f", FORCE_NOT_NULL ({', '.join(force)})"
+    return options
+
+
+def _flush_copy(cursor, buffer: io.StringIO, staging: str, columns: Sequence[str]):
+    """Отправляет накопленный CSV-буфер в staging-таблицу через COPY."""
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {staging} ({', '.join(columns)}) FROM STDIN WITH ({copy_options(columns)})",
+        buffer
+    )
+    buffer.seek(0)
+    buffer.truncate()
+
+
+def copy_to_staging(cursor, rows: Iterable[tuple], template: str = 'rdl.webm_api',
+                    columns: Sequence[str] = RECORD_FIELDS) -> Tuple[str, int]:
+    """Заливает кортежи через COPY во временную таблицу по образцу template.
+
+    Кортежи (например WebmasterRecord) пишутся в CSV как есть, порциями по
+    COPY_CHUNK_SIZE строк. Таблица создается один раз на соединение пула
+    (ON COMMIT DELETE ROWS): порции BatchWriter не создают и не удаляют
+    таблицу в каталоге на каждой транзакции. Строки живут до конца транзакции.
+    Возвращает имя staging-таблицы и число залитых строк.
+    """
+    staging = f"_stage_{template.replace('.', '_')}"
+    chunk_size = settings.app.copy_chunk_size
+
+    cursor.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+        f"(LIKE {template} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    # Повторный вызов в той же транзакции (upsert + propagate); DELETE, а не
+    # TRUNCATE - тот меняет relfilenode, т.е. снова пишет в каталог
+    cursor.execute(f"DELETE FROM {staging}")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    total = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        total += 1
+        if pending >= chunk_size:
+            _flush_copy(cursor, buffer, staging, columns)
+            pending = 0
+    if pending:
+        _flush_copy(cursor, buffer, staging, columns)
+
+    return staging, total
+
+
+def copy_records(db, rows: Iterable[tuple], table: str = 'rdl.webm_api',
+                 columns: Sequence[str] = RECORD_FIELDS) -> int:
+    """Bulk insert of tuples via COPY, skipping rows that already exist.
+
+    Строки попадают в staging-таблицу (см. copy_to_staging), откуда
+    переносятся в целевую через INSERT ... ON CONFLICT DO NOTHING. Работает
+    внутри транзакции переданной сессии. Возвращает число вставленных строк.
+    """
+    cursor = db.connection().connection.cursor()
+    try:
+        staging, _ = copy_to_staging(cursor, rows, table, columns)
+        column_list = ', '.join(columns)
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) "
+            f"SELECT {column_list} FROM {staging} ON CONFLICT DO NOTHING"
+        )
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def metrics_hash(alias: str) -> str:
+    """SQL-выражение с хешем метрик строки (для сравнения старых и новых значений)."""
+    return (f"md5(ROW({alias}.demand, {alias}.impressions, "
+            f"{alias}.clicks, {alias}.position)::text)")
+
+
+def upsert_records(db, records: Iterable[WebmasterRecord]) -> Tuple[Dict[str, int], List[WebmasterRecord]]:
+    """Upsert of rdl.webm_api rows that only touches changed metrics.
+
+    Новые ключи вставляются, существующие обновляются только если хеш
+    метрик отличается. Возвращает счетчики inserted/updated/unchanged
+    и список вставленных/измененных записей (для распространения в ppl).
+    """
+    key = 'date, page_path, query, device'
+    column_list = ', '.join(RECORD_FIELDS)
+    cursor = db.connection().connection.cursor()
+    try:
+        staging, _ = copy_to_staging(cursor, records)
+        cursor.execute(f"SELECT count(DISTINCT ({key})) FROM {staging}")
+        staged = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"INSERT INTO rdl.webm_api AS t ({column_list}) "
+            f"SELECT DISTINCT ON ({key}) {column_list} FROM {staging} "
+            f"ON CONFLICT ({key}) DO UPDATE SET "
+            f"demand = EXCLUDED.demand, impressions = EXCLUDED.impressions, "
+            f"clicks = EXCLUDED.clicks, position = EXCLUDED.position "
+            f"WHERE {metrics_hash('t')} IS DISTINCT FROM {metrics_hash('EXCLUDED')} "
+            f"RETURNING {', '.join('t.' + f for f in RECORD_FIELDS)}, (t.xmax = 0)"
+        )
+        changed = []
+        inserted = 0
+        for row in cursor.fetchall():
+            changed.append(WebmasterRecord(*row[:-1]))
+            inserted += int(row[-1])
+    finally:
+        cursor.close()
+
+    stats = {
+        'inserted': inserted,
+        'updated': len(changed) - inserted,
+        'unchanged': staged - len(changed)
+    }
+    return stats, changed
+
 def create_tables():
     """Создает таблицы в БД (если нужно)"""
     Base.metadata.create_all(bind=engine)
 
 # Импортируем ppl модели
+from models.ppl.models import Base as PplBase
 from models.ppl.models import WebmasterAggregated, WebmasterPositions, WebmasterClicks
 
+# Горячая таблица -> (холодная таблица, представление hot UNION ALL cold)
+COLD_TABLES = {
+    'rdl.webm_api': ('rdl.webm_api_cold', 'rdl.webm_api_all'),
+    'ppl.webmaster_aggregated': ('ppl.webmaster_aggregated_cold', 'ppl.webmaster_aggregated_all'),
+}
+# id в ppl уникален и нужен для max(id) в ETL
+COLD_UNIQUE_COLUMNS = {'ppl.webmaster_aggregated_cold': 'id'}
+
+
+def create_cold_storage():
+    """Создает холодные таблицы архива и представления *_all.
+
+    Холодная таблица - копия колонок горячей без индекса по ключу:
+    BRIN по date (в ppl еще уникальный id), fillfactor 100. COLD_TABLESPACE
+    позволяет вынести ее на дешевый диск. Данные в ней не сжаты: сжатие
+    PostgreSQL действует только на TOAST-значения, а запросы и URL для
+    этого слишком короткие.
+    """
+    tablespace = f" TABLESPACE {settings.app.cold_tablespace}" if settings.app.cold_tablespace else ""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for hot, (cold, view) in COLD_TABLES.items():
+            cold_name = cold.split('.', 1)[1]
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {cold} (LIKE {hot} INCLUDING DEFAULTS) "
+                f"WITH (fillfactor = 100){tablespace}"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{cold_name}_date ON {cold} USING brin (date)"
+            )
+            if cold in COLD_UNIQUE_COLUMNS:
+                column = COLD_UNIQUE_COLUMNS[cold]
+                cursor.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{cold_name}_{column} ON {cold} ({column})"
+                )
+            cursor.execute(
+                f"CREATE OR REPLACE VIEW {view} AS "
+                f"SELECT * FROM {hot} UNION ALL SELECT * FROM {cold}"
+            )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+# Таблица -> текстовые колонки с триграммными GIN-индексами (поиск по подстроке)
+SEARCH_INDEXES = {
+    'ppl.webmaster_aggregated': ('query', 'page_path'),
+    'ppl.webmaster_aggregated_cold': ('query', 'page_path'),
+}
+
+
+def create_search_indexes(concurrently: bool = False):
+    """Создает pg_trgm и GIN-индексы для LIKE/ILIKE '%...%' по query и page_path.
+
+    На больших существующих таблицах - concurrently=True (без блокировки
+    записи, но дольше).
+    """
+    mode = " CONCURRENTLY" if concurrently else ""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table, columns in SEARCH_INDEXES.items():
+            table_name = table.split('.', 1)[1]
+            for column in columns:
+                conn.execute(text(
+                    f"CREATE INDEX{mode} IF NOT EXISTS ix_{table_name}_{column}_trgm "
+                    f"ON {table} USING gin ({column} gin_trgm_ops)"
+                ))
+
 # Функция для создания всех таблиц
 def create_all_tables():
     """Create all tables for both rdl and ppl layers."""
     Base.metadata.create_all(bind=engine)
+    PplBase.metadata.create_all(bind=engine)
+    # create_all не добавляет колонки и индексы в уже существующие таблицы
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE rdl.webm_fetch_jobs ADD COLUMN IF NOT EXISTS depth integer NOT NULL DEFAULT 0"
+        ))
+    for model in (WebmasterFetchJob, WebmasterAggregated):
+        for index in model.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+    create_cold_storage()
+    create_search_indexes()
@@ -1,14 +1,20 @@
 """Models for PPL layer (processed data)."""
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Float, ForeignKey, Index, PrimaryKeyConstraint, func
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
+# Модели поверх представлений: не создаются через create_all
+ViewBase = declarative_base()
 
 
 class WebmasterAggregated(Base):
     """Aggregated webmaster data."""
     __tablename__ = 'webmaster_aggregated'
-    __table_args__ = {'schema': 'ppl'}
+    __table_args__ = (
+        # Ключ строки rdl: по нему ETL и refresh сопоставляют rdl с ppl
+        Index('ix_webmaster_aggregated_key', 'date', 'page_path', 'query', 'device'),
+        {'schema': 'ppl'}
+    )
     
     id = Column(Integer, primary_key=True)
     date = Column(Date, nullable=False)
@@ -24,6 +30,22 @@ class WebmasterAggregated(Base):
         return f"<WebmasterAggregated(id={self.id}, date={self.date}, query={self.query[:20]}...)>"
 
 
+class WebmasterAggregatedAll(ViewBase):
+    """Read-only: hot + archived ppl rows (view ppl.webmaster_aggregated_all)."""
+    __tablename__ = 'webmaster_aggregated_all'
+    __table_args__ = {'schema': 'ppl'}
+    
+    id = Column(Integer, primary_key=True)
+    date = Column(Date, nullable=False)
+    query = Column(String, nullable=False)
+    page_path = Column(String, nullable=False)
+    device = Column(String(20), nullable=False)
+    demand = Column(Integer, nullable=False)
+    impressions = Column(Integer, nullable=False)
+    clicks = Column(Integer, nullable=False)
+    position = Column(Float, nullable=False)
+
+
 class WebmasterPositions(Base):
     """Restored impression positions."""
     __tablename__ = 'webmaster_positions'
@@ -48,54 +70,59 @@ class WebmasterClicks(Base):
     
     def __repr__(self):
         return f"<WebmasterClicks(id={self.id}, pos={self.click_position}, order={self.impression_order})>"
-EOFcat > src/models/ppl/models.py << 'EOF'
-"""Models for PPL layer (processed data)."""
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-
-Base = declarative_base()
 
 
-class WebmasterAggregated(Base):
-    """Aggregated webmaster data."""
-    __tablename__ = 'webmaster_aggregated'
-    __table_args__ = {'schema': 'ppl'}
+class WebmasterRollupPage(Base):
+    """Weekly/monthly rollup by page and device."""
+    __tablename__ = 'webmaster_rollup_page'
+    __table_args__ = (
+        PrimaryKeyConstraint('grain', 'period_start', 'page_path', 'device'),
+        {'schema': 'ppl'}
+    )
     
-    id = Column(Integer, primary_key=True)
-    date = Column(Date, nullable=False)
-    query = Column(String, nullable=False)
+    grain = Column(String(10), nullable=False)  # 'week' | 'month'
+    period_start = Column(Date, nullable=False)
     page_path = Column(String, nullable=False)
     device = Column(String(20), nullable=False)
-    demand = Column(Integer, nullable=False)
-    impressions = Column(Integer, nullable=False)
-    clicks = Column(Integer, nullable=False)
-    position = Column(Float, nullable=False)
+    impressions = Column(BigInteger, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+    position_sum = Column(Float, nullable=False)  # sum(position * impressions)
     
     def __repr__(self):
-        return f"<WebmasterAggregated(id={self.id}, date={self.date}, query={self.query[:20]}...)>"
+        return f"<WebmasterRollupPage({self.grain} {self.period_start}, page={self.page_path[:20]}...)>"
 
 
-class WebmasterPositions(Base):
-    """Restored impression positions."""
-    __tablename__ = 'webmaster_positions'
-    __table_args__ = {'schema': 'ppl'}
+class WebmasterRollupQuery(Base):
+    """Weekly/monthly rollup by query and device."""
+    __tablename__ = 'webmaster_rollup_query'
+    __table_args__ = (
+        PrimaryKeyConstraint('grain', 'period_start', 'query', 'device'),
+        {'schema': 'ppl'}
+    )
     
-    id = Column(Integer, ForeignKey('ppl.webmaster_aggregated.id'), primary_key=True)
-    impression_position = Column(Integer, primary_key=True)
-    impression_order = Column(Integer, primary_key=True)
+    grain = Column(String(10), nullable=False)  # 'week' | 'month'
+    period_start = Column(Date, nullable=False)
+    query = Column(String, nullable=False)
+    device = Column(String(20), nullable=False)
+    impressions = Column(BigInteger, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+    position_sum = Column(Float, nullable=False)  # sum(position * impressions)
     
     def __repr__(self):
-        return f"<WebmasterPositions(id={self.id}, pos={self.impression_position}, order={self.impression_order})>"
+        return f"<WebmasterRollupQuery({self.grain} {self.period_start}, query={self.query[:20]}...)>"
 
 
-class WebmasterClicks(Base):
-    """Restored clicks data."""
-    __tablename__ = 'webmaster_clicks'
-    __table_args__ = {'schema': 'ppl'}
+class WebmasterRollupPeriod(Base):
+    """Periods whose rollup rows have been built (empty periods included)."""
+    __tablename__ = 'webmaster_rollup_periods'
+    __table_args__ = (
+        PrimaryKeyConstraint('grain', 'period_start'),
+        {'schema': 'ppl'}
+    )
     
-    id = Column(Integer, ForeignKey('ppl.webmaster_aggregated.id'), primary_key=True)
-    click_position = Column(Integer, primary_key=True)
-    impression_order = Column(Integer, primary_key=True)
+    grain = Column(String(10), nullable=False)  # 'week' | 'month'
+    period_start = Column(Date, nullable=False)
+    built_at = Column(DateTime, nullable=False, server_default=func.now())
     
     def __repr__(self):
-        return f"<WebmasterClicks(id={self.id}, pos={self.click_position}, order={self.impression_order})>"
+        return f"<WebmasterRollupPeriod({self.grain} {self.period_start})>"
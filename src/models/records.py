@@ -0,0 +1,27 @@
+"""Compact in-flight record type shared by loaders, ETL and writers."""
+from typing import NamedTuple, Tuple
+from datetime import date as date_type
+
+
+class WebmasterRecord(NamedTuple):
+    """Одна строка статистики Вебмастера.
+
+    Порядок полей совпадает с порядком колонок в COPY (см. RECORD_FIELDS),
+    поэтому кортеж можно отдавать в writer без преобразований.
+    """
+    date: date_type
+    page_path: str
+    query: str
+    demand: int
+    impressions: int
+    clicks: int
+    position: float
+    device: str
+
+    @property
+    def key(self) -> Tuple[date_type, str, str, str]:
+        """Natural key of the row (matches rdl.webm_api primary key)."""
+        return (self.date, self.page_path, self.query, self.device)
+
+
+RECORD_FIELDS = WebmasterRecord._fields
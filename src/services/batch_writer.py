@@ -0,0 +1,70 @@
+"""Batched writer for rdl.webm_api with savepoint-based error isolation."""
+import json
+import logging
+from datetime import date
+from typing import Dict, Optional, Sequence
+
+from config.settings import settings
+from models.database import get_db, copy_records, WebmasterDeadLetter
+from models.records import WebmasterRecord
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Пишет записи порциями по BATCH_SIZE, каждая порция - своя транзакция.
+
+    На чистых данных порция уходит одним COPY внутри savepoint. Если порция
+    падает, она делится пополам (каждая половина в своем savepoint) до тех
+    пор, пока не останутся отдельные проблемные строки - они уходят
+    в rdl.webm_api_dead_letter, остальные сохраняются.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or settings.app.batch_size
+
+    def write(self, records: Sequence[WebmasterRecord]) -> Dict[str, int]:
+        """Returns counters: saved, quarantined, failed_batches."""
+        stats = {'saved': 0, 'quarantined': 0, 'failed_batches': 0}
+
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            try:
+                with get_db() as db:
+                    saved, quarantined = self._write_isolated(db, batch)
+                stats['saved'] += saved
+                stats['quarantined'] += quarantined
+            except Exception as e:
+                # Ошибка вне savepoint (например, потеря соединения) - теряем только эту порцию
+                logger.error(f"Порция {start}-{start + len(batch)} не записана: {e}")
+                stats['failed_batches'] += 1
+
+        if stats['quarantined']:
+            logger.warning(f"В карантин отправлено {stats['quarantined']} записей")
+        return stats
+
+    def _write_isolated(self, db, batch: Sequence[WebmasterRecord]):
+        """Writes batch inside a savepoint, bisecting on failure."""
+        try:
+            with db.begin_nested():
+                return copy_records(db, batch), 0
+        except Exception as e:
+            if len(batch) == 1:
+                self._quarantine(db, batch[0], e)
+                return 0, 1
+
+        middle = len(batch) // 2
+        left_saved, left_bad = self._write_isolated(db, batch[:middle])
+        right_saved, right_bad = self._write_isolated(db, batch[middle:])
+        return left_saved + right_saved, left_bad + right_bad
+
+    def _quarantine(self, db, record: WebmasterRecord, error: Exception):
+        """Stores an unwritable record in the dead-letter table."""
+        logger.debug(f"Карантин: {record!r}: {error}")
+        with db.begin_nested():
+            db.add(WebmasterDeadLetter(
+                date=record.date if isinstance(record.date, date) else None,
+                payload=json.dumps(list(record), default=str),
+                error=str(error)[:2000]
+            ))
+
@@ -1,59 +1,109 @@
-from typing import List, Dict, Any
-from models.database import get_db, WebmasterData
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from datetime import datetime
+from config.settings import settings
+from models.database import get_db, upsert_records
+from models.records import WebmasterRecord
 from api.webmaster_client import WebmasterClient
+from services.batch_writer import BatchWriter
+from services.pipeline import FetchWritePipeline
+from services.key_set import ExistingKeySet
 
 
 class DataLoader:
     def __init__(self, client: WebmasterClient):
         self.client = client
         self.device_types = ['DESKTOP', 'MOBILE', 'TABLET']
+        self.writer = BatchWriter()
+        self.last_url_count = 0
+        self.last_failed_batches = 0
+        self.last_rows_fetched = 0  # строк скачано из API до отсева и дедупликации
+
+    def _fetch_pages(self, target_date: str, urls: set) -> Iterator[List[WebmasterRecord]]:
+        """Producer: pages of search-queries for the date, as records for every device."""
+        for queries in self.client.iter_query_pages(target_date):
+            queries = [q for q in queries if q.get('page_url') and q.get('page_url') != 'N/A']
+            urls.update(q['page_url'] for q in queries)
+            records = []
+            for device in self.device_types:
+                records.extend(self.client.records_from_rows(target_date, queries, device))
+            self.last_rows_fetched += len(records)
+            yield records
 
     def load_data_for_date(self, target_date: str) -> int:
         print(f"Загрузка данных за {target_date}...")
+        self.last_failed_batches = 0
+        self.last_rows_fetched = 0
 
-        # Получаем все URL для даты
-        urls = self.client.get_urls_for_date(target_date)
-        print(f"Найдено {len(urls)} URL для обработки")
+        # Уже сохраненные ключи даты загружаются одним запросом
+        existing_keys = None
+        if settings.app.preload_keys:
+            existing_keys = ExistingKeySet.load(datetime.strptime(target_date, '%Y-%m-%d').date())
+
+        # Страницы API скачиваются в потоке-производителе, пока писатель
+        # сохраняет предыдущие: сеть и запись идут одновременно. Листание
+        # последовательное (следующий offset известен после страницы),
+        # поэтому производитель один
+        urls: set = set()
+        pipeline = FetchWritePipeline(
+            fetch=lambda day: self._fetch_pages(day, urls),
+            write=self._save_records,
+            transform=existing_keys.filter if existing_keys else None,
+            fetch_workers=1
+        )
+        total_records = pipeline.run([(target_date,)])
+        self.last_url_count = len(urls)
 
         if not urls:
             print(f"Нет URL с данными за {target_date}")
             return 0
+        print(f"Обработано {len(urls)} URL")
 
-        total_records = 0
-
-        for url in urls:
-            for device in self.device_types:
-                records = self.client.get_queries_for_url_and_date(target_date, url, device)
-                saved = self._save_records(records)
-                total_records += saved
+        if existing_keys:
+            print(f"Отсеяно уже сохраненных записей: {existing_keys.filtered_out}")
 
         print(f"Загружено {total_records} записей за {target_date}")
         return total_records
 
-    def _save_records(self, records: List[Dict[str, Any]]) -> int:
+    def fetch_records_for_date(self, target_date: str) -> List[WebmasterRecord]:
+        """Скачивает все записи за дату без записи в БД."""
+        records = []
+        for url in self.client.get_urls_for_date(target_date):
+            for device in self.device_types:
+                records.extend(self.client.get_queries_for_url_and_date(target_date, url, device))
+        return records
+
+    def refresh_data_for_date(self, target_date: str,
+                              propagate: Optional[Callable] = None) -> Tuple[Dict[str, int], List[WebmasterRecord]]:
+        """Перезагружает дату и обновляет только изменившиеся строки.
+
+        propagate(db, changed) выполняется в той же транзакции, что и upsert:
+        если перенос в ppl упал, откатывается и rdl, и следующий refresh
+        снова увидит эти строки измененными.
+        """
+        print(f"Обновление данных за {target_date}...")
+        records = self.fetch_records_for_date(target_date)
+
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        changed = []
+        if records:
+            with get_db() as db:
+                stats, changed = upsert_records(db, records)
+                if propagate and changed:
+                    propagate(db, changed)
+
+        print(f"{target_date}: добавлено {stats['inserted']}, обновлено {stats['updated']}, "
+              f"без изменений {stats['unchanged']}")
+        return stats, changed
+
+    def _save_records(self, records: List[WebmasterRecord]) -> int:
         if not records:
             return 0
 
-        saved_count = 0
-        try:
-            with get_db() as db:
-                for record_data in records:
-                    # Проверяем дубликаты
-                    exists = db.query(WebmasterData).filter(
-                        WebmasterData.date == record_data['date'],
-                        WebmasterData.page_path == record_data['page_path'],
-                        WebmasterData.query == record_data['query'],
-                        WebmasterData.device == record_data['device']
-                    ).first()
-
-                    if not exists:
-                        record = WebmasterData(**record_data)
-                        db.add(record)
-                        saved_count += 1
-
-                print(f"Добавлено {saved_count} новых записей")
-
-        except Exception as e:
-            print(f"Ошибка при сохранении: {e}")
-
-        return saved_count
+        # Порции по BATCH_SIZE, битые строки уходят в карантин
+        stats = self.writer.write(records)
+        self.last_failed_batches += stats['failed_batches']
+        print(f"Добавлено {stats['saved']} новых записей")
+        if stats['quarantined'] or stats['failed_batches']:
+            print(f"В карантине: {stats['quarantined']}, незаписанных порций: {stats['failed_batches']}")
+
+        return stats['saved']
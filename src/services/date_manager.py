@@ -1,8 +1,9 @@
 from typing import List, Set
 from datetime import datetime, timedelta
 from config.settings import settings
-from models.database import get_db, WebmasterData
+from models.database import get_db, WebmasterDataAll
 from api.webmaster_client import WebmasterClient
+from services.job_queue import JobQueue
 
 
 class DateManager:
@@ -13,10 +14,21 @@ class DateManager:
         existing_dates = set()
         try:
             with get_db() as db:
-                dates = db.query(WebmasterData.date).distinct().all()
+                # Вместе с архивом: перенесенные даты не считаются пропущенными
+                dates = db.query(WebmasterDataAll.date).distinct().all()
                 existing_dates = {date[0].strftime('%Y-%m-%d') for date in dates}
         except Exception as e:
             print(f"Error getting dates from DB: {e}")
+
+        # Даты из очереди задач: полностью выполненные считаются загруженными,
+        # с незавершенными задачами - нет (даже если часть строк уже есть)
+        try:
+            queue = JobQueue()
+            completed = {d.strftime('%Y-%m-%d') for d in queue.get_completed_dates()}
+            unfinished = {d.strftime('%Y-%m-%d') for d in queue.get_unfinished_dates()}
+            existing_dates = (existing_dates - unfinished) | completed
+        except Exception as e:
+            print(f"Error getting job queue state: {e}")
         return existing_dates
 
     def get_missing_dates(self) -> List[str]:
@@ -33,14 +45,11 @@ class DateManager:
             all_dates.append(current_date.strftime('%Y-%m-%d'))
             current_date += timedelta(days=1)
 
-        # Проверяем какие даты есть в API
-        available_dates = []
+        # Проверяем в API только даты, которых еще нет в БД
+        missing_dates = []
         for date_str in all_dates:
-            if self.client.check_date_has_data(date_str):
-                available_dates.append(date_str)
-
-        # Находим недостающие
-        missing_dates = [date for date in available_dates if date not in existing_dates]
+            if date_str not in existing_dates and self.client.check_date_has_data(date_str):
+                missing_dates.append(date_str)
 
-        print(f"Статистика: {len(available_dates)} доступно, {len(existing_dates)} в БД, {len(missing_dates)} отсутствует")
+        print(f"Статистика: {len(all_dates)} дат в окне, {len(existing_dates)} в БД, {len(missing_dates)} отсутствует")
         return missing_dates
@@ -0,0 +1,306 @@
+"""PostgreSQL-backed work queue for date × URL × device fetch tasks."""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import date
+from typing import List, NamedTuple, Optional, Set
+
+from sqlalchemy import select, func
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from config.settings import settings
+from core.dedup import RecordDeduplicator, containment_levels
+from models.database import get_db, WebmasterData, WebmasterFetchJob
+from models.records import WebmasterRecord, RECORD_FIELDS
+from services.batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+DEVICE_TYPES = ['DESKTOP', 'MOBILE', 'TABLET']
+# Пауза воркера, когда все выдаваемые задачи ждут более длинных URL
+BLOCKED_POLL_SECONDS = 1.0
+
+
+class FetchJob(NamedTuple):
+    id: int
+    date: date
+    page_url: str
+    device: str
+
+
+class JobQueue:
+    """Очередь задач в таблице rdl.webm_fetch_jobs.
+
+    Задачу забирает любой процесс на любой машине через
+    SELECT ... FOR UPDATE SKIP LOCKED и получает аренду (lease) на
+    JOB_LEASE_SECONDS. Если воркер упал, аренда истекает и задачу забирает
+    другой. После JOB_MAX_ATTEMPTS неудач задача помечается failed.
+
+    С URL_EXACT_MATCH задачи даты разбиты на ярусы (depth, см.
+    core.dedup.containment_levels, считается один раз при постановке):
+    задача выдается, когда выполнены все задачи даты с меньшим depth, в
+    том числе задачи более длинных URL, содержащих ее URL, - воркер
+    вычитает их строки (см. JobWorker.process), как RecordDeduplicator
+    в последовательной загрузке. Выдача и проверка яруса идут по
+    частичному индексу (date, depth, id) незавершенных задач.
+    """
+
+    def __init__(self, lease_seconds: Optional[int] = None, max_attempts: Optional[int] = None):
+        self.lease_seconds = lease_seconds or settings.app.job_lease_seconds
+        self.max_attempts = max_attempts or settings.app.job_max_attempts
+
+    def enqueue_date(self, target_date: date, urls: List[str], devices: List[str] = DEVICE_TYPES) -> int:
+        """Add tasks for a date; known tasks keep their state, only their depth is updated.
+
+        Возвращает число добавленных задач и задач, чей ярус изменился
+        (новый URL за дату может содержать уже поставленные).
+        """
+        levels = containment_levels(urls) if settings.app.url_exact_match else {}
+        rows = [
+            {'date': target_date, 'page_url': url, 'device': device, 'depth': levels.get(url, 0)}
+            for url in urls for device in devices
+        ]
+        added = 0
+        with get_db() as db:
+            for start in range(0, len(rows), settings.app.batch_size):
+                statement = insert(WebmasterFetchJob).values(rows[start:start + settings.app.batch_size])
+                statement = statement.on_conflict_do_update(
+                    index_elements=['date', 'page_url', 'device'],
+                    set_={'depth': statement.excluded.depth},
+                    where=WebmasterFetchJob.depth != statement.excluded.depth
+                )
+                added += db.execute(statement).rowcount
+        return added
+
+    @staticmethod
+    def _lower_tiers_done() -> str:
+        """Claim filter: every task of the date in a lower tier is done (index probe)."""
+        if not settings.app.url_exact_match:
+            return ""
+        return """AND NOT EXISTS (
+                          SELECT 1 FROM rdl.webm_fetch_jobs o
+                          WHERE o.date = j.date AND o.depth < j.depth AND o.status <> 'done'
+                      )"""
+
+    def claim(self, worker_id: str, limit: int = 1) -> List[FetchJob]:
+        """Lease up to limit runnable tasks without blocking other workers."""
+        with get_db() as db:
+            # Просроченные аренды без оставшихся попыток больше не выдаются
+            db.execute(text("""
+                UPDATE rdl.webm_fetch_jobs
+                SET status = 'failed', error = coalesce(error, 'lease expired'), updated_at = now()
+                WHERE status = 'running' AND lease_until < now() AND attempts >= :max_attempts
+            """), {'max_attempts': self.max_attempts})
+            
+            rows = db.execute(text(f"""
+                UPDATE rdl.webm_fetch_jobs
+                SET status = 'running', attempts = attempts + 1, worker_id = :worker_id,
+                    lease_until = now() + make_interval(secs => :lease), updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM rdl.webm_fetch_jobs j
+                    WHERE status <> 'done'
+                      AND (status = 'pending' OR (status = 'running' AND lease_until < now()))
+                      AND attempts < :max_attempts
+                      {self._lower_tiers_done()}
+                    ORDER BY date, depth, id
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, date, page_url, device
+            """), {
+                'worker_id': worker_id,
+                'lease': self.lease_seconds,
+                'max_attempts': self.max_attempts,
+                'limit': limit,
+            }).fetchall()
+        return [FetchJob(*row) for row in rows]
+
+    def is_blocked(self) -> bool:
+        """True when claim() found nothing only because runnable tasks wait for running ones.
+
+        Пустой claim() означает либо "очередь пуста", либо "оставшиеся задачи
+        ждут яруса, который еще выполняют другие воркеры" - во втором случае
+        воркер должен ждать, а не завершаться.
+        """
+        with get_db() as db:
+            return db.execute(text("""
+                SELECT EXISTS (
+                           SELECT 1 FROM rdl.webm_fetch_jobs
+                           WHERE status = 'running' AND lease_until >= now()
+                       )
+                   AND EXISTS (
+                           SELECT 1 FROM rdl.webm_fetch_jobs
+                           WHERE status = 'pending' AND attempts < :max_attempts
+                       )
+            """), {'max_attempts': self.max_attempts}).scalar()
+
+    def complete(self, job: FetchJob, worker_id: str, rows: int):
+        with get_db() as db:
+            db.execute(text("""
+                UPDATE rdl.webm_fetch_jobs
+                SET status = 'done', rows = :rows, error = NULL, lease_until = NULL, updated_at = now()
+                WHERE id = :id AND worker_id = :worker_id
+            """), {'id': job.id, 'worker_id': worker_id, 'rows': rows})
+
+    def fail(self, job: FetchJob, worker_id: str, error: Exception):
+        """Return the task to the queue, or mark failed after max attempts."""
+        with get_db() as db:
+            db.execute(text("""
+                UPDATE rdl.webm_fetch_jobs
+                SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+                    error = :error, lease_until = NULL, updated_at = now()
+                WHERE id = :id AND worker_id = :worker_id
+            """), {'id': job.id, 'worker_id': worker_id,
+                   'max_attempts': self.max_attempts, 'error': str(error)[:2000]})
+
+    def requeue_failed(self, dates: Optional[List[date]] = None) -> int:
+        """Return failed tasks (optionally only for dates) to pending with fresh attempts."""
+        condition = "status = 'failed'"
+        params = {}
+        if dates:
+            condition += " AND date = ANY(:dates)"
+            params['dates'] = list(dates)
+        with get_db() as db:
+            result = db.execute(text(f"""
+                UPDATE rdl.webm_fetch_jobs
+                SET status = 'pending', attempts = 0, lease_until = NULL, updated_at = now()
+                WHERE {condition}
+            """), params)
+            return result.rowcount
+
+    def clear_date(self, target_date: date) -> int:
+        """Drop unfinished tasks of a date that was loaded by the direct (non-queue) path.
+
+        Иначе failed-задачи навсегда держали бы дату "незавершенной", и
+        collect_missing_data скачивал бы ее снова каждый запуск.
+        """
+        with get_db() as db:
+            result = db.execute(text(
+                "DELETE FROM rdl.webm_fetch_jobs WHERE date = :date AND status <> 'done'"
+            ), {'date': target_date})
+            return result.rowcount
+
+    def get_completed_dates(self) -> Set[date]:
+        """Dates whose every task is done."""
+        with get_db() as db:
+            rows = db.execute(text("""
+                SELECT date FROM rdl.webm_fetch_jobs
+                GROUP BY date HAVING bool_and(status = 'done')
+            """))
+            return {row[0] for row in rows}
+
+    def get_unfinished_dates(self) -> Set[date]:
+        """Dates that still have pending, running or failed tasks."""
+        with get_db() as db:
+            rows = db.execute(text(
+                "SELECT DISTINCT date FROM rdl.webm_fetch_jobs WHERE status <> 'done'"
+            ))
+            return {row[0] for row in rows}
+
+
+class JobWorker:
+    """Воркер: забирает задачи из очереди в нескольких потоках, скачивает и пишет в rdl."""
+
+    def __init__(self, loader, queue: Optional[JobQueue] = None, worker_id: Optional[str] = None,
+                 threads: Optional[int] = None):
+        self.loader = loader  # WebmasterDataLoader
+        self.queue = queue or JobQueue()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.threads = threads or settings.app.fetch_workers
+        self.writer = BatchWriter()
+
+    def process(self, job: FetchJob) -> int:
+        """Fetch and store one task; raises so the task can be retried."""
+        target_date = job.date.strftime('%Y-%m-%d')
+        records = self.loader.get_queries_for_url_and_date(
+            target_date, job.page_url, job.device, raise_errors=True
+        )
+        records = [r for r in records if r.demand > 0]
+        if settings.app.url_exact_match and records:
+            # TEXT_MATCH включает более длинные URL - вычитаем их уже записанные строки
+            dedup = RecordDeduplicator(exact_url_match=True)
+            dedup.add_claims(self._stored_longer_url_rows(job))
+            records = dedup.filter(job.page_url, records)
+        stats = self.writer.write(records)
+        if stats['failed_batches']:
+            raise RuntimeError(f"{stats['failed_batches']} batches were not written")
+        return stats['saved']
+
+    def _stored_longer_url_rows(self, job: FetchJob) -> List[WebmasterRecord]:
+        """Rows of the same date and device stored for longer URLs containing job.page_url."""
+        with get_db() as db:
+            rows = db.execute(
+                select(*(getattr(WebmasterData, f) for f in RECORD_FIELDS))
+                .where(WebmasterData.date == job.date)
+                .where(WebmasterData.device == job.device.lower())
+                .where(WebmasterData.page_path != job.page_url)
+                .where(func.strpos(WebmasterData.page_path, job.page_url) > 0)
+            )
+            return [WebmasterRecord(*row) for row in rows]
+
+    def run(self, forever: bool = False, poll_seconds: Optional[int] = None) -> int:
+        """Work until nothing is left to claim or wait for (or forever, polling). Returns rows saved.
+
+        Задачи выполняются в threads потоках: каждый забирает свою задачу,
+        а сколько запросов реально идет в API одновременно, решает общий
+        AIMD-лимитер загрузчика. Первая ошибка потока пробрасывается.
+        """
+        poll_seconds = poll_seconds or settings.app.worker_poll_seconds
+        logger.info(f"Воркер {self.worker_id} запущен, потоков: {self.threads}")
+
+        totals: List[int] = []
+        errors: List[BaseException] = []
+        lock = threading.Lock()
+
+        def work(worker_id: str):
+            try:
+                saved = self._work(worker_id, forever, poll_seconds)
+                with lock:
+                    totals.append(saved)
+            except BaseException as e:
+                logger.error(f"Поток {worker_id} остановлен: {e}")
+                with lock:
+                    errors.append(e)
+
+        threads = [
+            threading.Thread(target=work, args=(f"{self.worker_id}/{i}",), name=f"job-worker-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        saved_total = sum(totals)
+        logger.info(f"Воркер {self.worker_id} завершен, сохранено {saved_total} записей")
+        if errors:
+            raise errors[0]
+        return saved_total
+
+    def _work(self, worker_id: str, forever: bool, poll_seconds: int) -> int:
+        """Claim/process loop of one worker thread."""
+        saved_total = 0
+        while True:
+            jobs = self.queue.claim(worker_id)
+            if not jobs:
+                if self.queue.is_blocked():
+                    # Задачи есть, но ждут более длинных URL у других воркеров
+                    time.sleep(min(poll_seconds, BLOCKED_POLL_SECONDS))
+                    continue
+                if not forever:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            for job in jobs:
+                try:
+                    saved = self.process(job)
+                    self.queue.complete(job, worker_id, saved)
+                    saved_total += saved
+                except Exception as e:
+                    logger.error(f"Задача {job.id} ({job.date} {job.device}) не выполнена: {e}")
+                    self.queue.fail(job, worker_id, e)
+        return saved_total
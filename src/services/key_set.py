@@ -0,0 +1,138 @@
+"""Preloaded per-date key sets for duplicate detection before writing."""
+import hashlib
+import logging
+import math
+import sys
+import threading
+from datetime import date
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, func, tuple_
+
+from config.settings import settings
+from models.database import get_db, WebmasterDataAll
+from models.records import WebmasterRecord
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str]  # (page_path, query, device)
+
+# Ключей в одном запросе перепроверки положительных ответов Блума
+VERIFY_CHUNK_SIZE = 5000
+
+
+class BloomFilter:
+    """Компактный фильтр Блума для очень больших дат.
+
+    Отрицательный ответ точный; положительный - "возможно есть"
+    с вероятностью ложного срабатывания около error_rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: Key) -> Iterable[int]:
+        digest = hashlib.blake2b('\x1f'.join(key).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: Key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: Key) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class ExistingKeySet:
+    """Ключи (page_path, query, device), уже лежащие в rdl за дату.
+
+    Читается представление rdl.webm_api_all (горячие + архивные строки),
+    так что повторная загрузка заархивированной даты не дублирует данные.
+
+    Загружаются одним запросом. До BLOOM_THRESHOLD ключей хранится точный
+    set; для больших дат - фильтр Блума, а его положительные ответы
+    перепроверяются одним запросом на порцию, так что новые строки
+    не теряются.
+    """
+
+    def __init__(self, target_date: date):
+        self.target_date = target_date
+        self.keys: Optional[Set[Key]] = None
+        self.bloom: Optional[BloomFilter] = None
+        self.count = 0
+        self.filtered_out = 0
+        self._lock = threading.Lock()  # filter() вызывается из fetch-воркеров
+
+    @classmethod
+    def load(cls, target_date: date) -> 'ExistingKeySet':
+        key_set = cls(target_date)
+        key_columns = (WebmasterDataAll.page_path, WebmasterDataAll.query, WebmasterDataAll.device)
+
+        with get_db() as db:
+            key_set.count = db.execute(
+                select(func.count()).select_from(WebmasterDataAll).where(WebmasterDataAll.date == target_date)
+            ).scalar()
+
+            statement = (
+                select(*key_columns)
+                .where(WebmasterDataAll.date == target_date)
+                .execution_options(stream_results=True, yield_per=settings.app.etl_chunk_size)
+            )
+            if key_set.count > settings.app.bloom_threshold:
+                key_set.bloom = BloomFilter(key_set.count)
+                for row in db.execute(statement):
+                    key_set.bloom.add(tuple(row))
+            else:
+                key_set.keys = {tuple(row) for row in db.execute(statement)}
+
+        logger.info(
+            f"Ключи за {target_date}: {key_set.count} "
+            f"({'bloom' if key_set.bloom else 'set'}, ~{key_set.memory_bytes() / 2 ** 20:.1f} MiB)"
+        )
+        return key_set
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the key structure."""
+        if self.bloom is not None:
+            return sys.getsizeof(self.bloom.bits)
+        if not self.keys:
+            return 0
+        return sys.getsizeof(self.keys) + sum(
+            sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+            for key in self.keys
+        )
+
+    def _verify(self, candidates: List[WebmasterRecord]) -> Set[Key]:
+        """Exact check of Bloom positives, VERIFY_CHUNK_SIZE keys per query."""
+        existing: Set[Key] = set()
+        if not candidates:
+            return existing
+        key_columns = tuple_(WebmasterDataAll.page_path, WebmasterDataAll.query, WebmasterDataAll.device)
+        with get_db() as db:
+            for start in range(0, len(candidates), VERIFY_CHUNK_SIZE):
+                chunk = candidates[start:start + VERIFY_CHUNK_SIZE]
+                rows = db.execute(
+                    select(WebmasterDataAll.page_path, WebmasterDataAll.query, WebmasterDataAll.device)
+                    .where(WebmasterDataAll.date == self.target_date)
+                    .where(key_columns.in_([(r.page_path, r.query, r.device) for r in chunk]))
+                )
+                existing.update(tuple(row) for row in rows)
+        return existing
+
+    def filter(self, records: List[WebmasterRecord]) -> List[WebmasterRecord]:
+        """Drop records whose key already exists for the date."""
+        if self.keys is not None:
+            kept = [r for r in records if (r.page_path, r.query, r.device) not in self.keys]
+        else:
+            maybe = [r for r in records if (r.page_path, r.query, r.device) in self.bloom]
+            existing = self._verify(maybe)
+            kept = [r for r in records if (r.page_path, r.query, r.device) not in existing]
+
+        with self._lock:
+            self.filtered_out += len(records) - len(kept)
+        return kept
@@ -0,0 +1,152 @@
+"""Producer/consumer pipeline: parallel API fetch -> transform -> single DB writer."""
+import logging
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from config.settings import settings
+from models.records import WebmasterRecord
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # маркер завершения воркера
+
+FetchTask = Tuple  # аргументы fetch, например (page_url, device)
+FetchResult = Union[List[WebmasterRecord], Iterator[List[WebmasterRecord]]]
+
+
+class FetchWritePipeline:
+    """Сеть и запись в БД работают одновременно.
+
+    fetch_workers потоков берут задачи (например, (url, device)), скачивают
+    и преобразуют записи и кладут их в ограниченную очередь. fetch может
+    вернуть список записей или итератор списков (постраничная выгрузка) -
+    тогда каждая страница уходит писателю, не дожидаясь остальных. Один писатель
+    (вызывающий поток) копит записи до batch_size и отдает их в write.
+    Если писатель не успевает, очередь заполняется и воркеры ждут
+    (backpressure). Первая ошибка любого участника останавливает остальных
+    и пробрасывается из run().
+    """
+
+    def __init__(self,
+                 fetch: Callable[..., FetchResult],
+                 write: Callable[[List[WebmasterRecord]], int],
+                 transform: Optional[Callable[[List[WebmasterRecord]], List[WebmasterRecord]]] = None,
+                 fetch_workers: Optional[int] = None,
+                 queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None):
+        self.fetch = fetch
+        self.write = write
+        self.transform = transform
+        self.fetch_workers = fetch_workers or settings.app.fetch_workers
+        self.queue_size = queue_size or settings.app.pipeline_queue_size
+        self.batch_size = batch_size or settings.app.batch_size
+
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._lock = threading.Lock()
+
+    def _fail(self, error: BaseException):
+        with self._lock:
+            self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, results: queue.Queue, item) -> bool:
+        """Blocking put that gives up when the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch_worker(self, tasks: queue.Queue, results: queue.Queue):
+        try:
+            while not self._stop.is_set():
+                try:
+                    task = tasks.get_nowait()
+                except queue.Empty:
+                    break
+
+                result = self.fetch(*task)
+                chunks = result if isinstance(result, Iterator) else (result,)
+                for records in chunks:
+                    if self._stop.is_set():
+                        break
+                    if self.transform:
+                        records = self.transform(records)
+                    if records and not self._put(results, records):
+                        break
+        except BaseException as e:
+            logger.error(f"Ошибка в fetch-воркере: {e}")
+            self._fail(e)
+        finally:
+            # Маркер кладется всегда, иначе писатель не узнает о завершении
+            while True:
+                try:
+                    results.put(_DONE, timeout=0.5)
+                    break
+                except queue.Full:
+                    if self._stop.is_set():
+                        break
+
+    def run(self, tasks: Iterable[FetchTask]) -> int:
+        """Process all tasks, returns the total reported by write()."""
+        self._stop.clear()
+        self._errors = []
+
+        task_queue: queue.Queue = queue.Queue()
+        for task in tasks:
+            task_queue.put(task)
+
+        results: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        workers = [
+            threading.Thread(
+                target=self._fetch_worker, args=(task_queue, results),
+                name=f"fetch-{i}", daemon=True
+            )
+            for i in range(self.fetch_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        written = 0
+        buffer: List[WebmasterRecord] = []
+        finished = 0
+        try:
+            while finished < len(workers):
+                try:
+                    item = results.get(timeout=0.5)
+                except queue.Empty:
+                    if self._stop.is_set() and not any(w.is_alive() for w in workers):
+                        break
+                    continue
+
+                if item is _DONE:
+                    finished += 1
+                    continue
+
+                buffer.extend(item)
+                if len(buffer) >= self.batch_size:
+                    written += self.write(buffer)
+                    buffer = []
+
+            if buffer and not self._stop.is_set():
+                written += self.write(buffer)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            # Освобождаем место в очереди, чтобы заблокированные воркеры вышли
+            while any(w.is_alive() for w in workers):
+                try:
+                    results.get_nowait()
+                except queue.Empty:
+                    pass
+                for worker in workers:
+                    worker.join(timeout=0.1)
+
+        if self._errors:
+            raise self._errors[0]
+        return written
@@ -0,0 +1,163 @@
+"""Dry-run cost planner for backfills."""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func
+
+from config.settings import settings
+from models.database import get_db, WebmasterData, WebmasterRunMetrics
+from services.job_queue import DEVICE_TYPES
+from api.webmaster_client import PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Оценки по умолчанию, пока нет истории запусков. Путь сбора: DataLoader ->
+# WebmasterClient, который листает search-queries за дату страницами по
+# PAGE_SIZE и раскладывает строки по URL и устройствам
+DEFAULT_RATIOS = {
+    'api_rows_per_date': 1000.0,
+    'urls_per_api_row': 0.2,
+    'bytes_per_row': 300.0,
+    'seconds_per_request': 1.0,
+    'from_history': 0.0,       # 1 - отношения посчитаны по rdl.webm_run_metrics
+}
+
+
+def requests_for_rows(api_rows: int) -> int:
+    """Requests collect_for_period makes for one date with api_rows search-queries rows.
+
+    Только страницы списка: floor(n / PAGE_SIZE) + 1, последняя неполная
+    (или пустая) страница завершает листание.
+    """
+    return api_rows // PAGE_SIZE + 1
+
+
+class DatePlan(NamedTuple):
+    date: str
+    urls: int
+    source: str  # 'probe' | 'history'
+    requests: int
+    rows: int
+    bytes: int
+    seconds: float
+
+
+class BackfillPlanner:
+    """Оценивает стоимость сбора периода, ничего не скачивая.
+
+    Число строк search-queries за дату берется пробой первой страницы
+    (WebmasterClient.probe_row_count; страница остается в кеше клиента),
+    а если API не вернул count - из среднего по истории. Запросы
+    считаются по числу страниц, строки - по числу устройств, байты и
+    время - по отношениям из rdl.webm_run_metrics (фактические затраты
+    прошлых запусков).
+    """
+
+    def __init__(self, client=None, daily_quota: Optional[int] = None):
+        self.client = client  # WebmasterClient, нужен для проб
+        self.daily_quota = daily_quota or settings.app.daily_request_quota
+        self.devices = len(DEVICE_TYPES)  # строка API пишется для каждого устройства
+
+    def load_ratios(self) -> Dict[str, float]:
+        """Cost ratios from past runs, falling back to defaults."""
+        ratios = dict(DEFAULT_RATIOS)
+        try:
+            with get_db() as db:
+                totals = db.query(
+                    func.count(WebmasterRunMetrics.date),
+                    func.sum(WebmasterRunMetrics.urls),
+                    func.sum(WebmasterRunMetrics.requests),
+                    func.sum(WebmasterRunMetrics.rows),
+                    func.sum(WebmasterRunMetrics.bytes),
+                    func.sum(WebmasterRunMetrics.seconds),
+                ).filter(WebmasterRunMetrics.rows > 0).one()
+                dates, urls, requests, rows, bytes_, seconds = totals
+
+                if dates:
+                    api_rows = rows / self.devices
+                    ratios['from_history'] = 1.0
+                    ratios['api_rows_per_date'] = api_rows / dates
+                    ratios['urls_per_api_row'] = urls / api_rows
+                    ratios['bytes_per_row'] = bytes_ / rows
+                    if requests:
+                        ratios['seconds_per_request'] = seconds / requests
+                else:
+                    # Нет метрик - хотя бы строки на дату из уже собранных данных
+                    rows, dates = db.query(
+                        func.count(), func.count(func.distinct(WebmasterData.date))
+                    ).one()
+                    if dates:
+                        ratios['api_rows_per_date'] = rows / dates / self.devices
+        except Exception as e:
+            logger.warning(f"Could not load run history, using defaults: {e}")
+        return ratios
+
+    def plan_date(self, date_str: str, ratios: Dict[str, float]) -> DatePlan:
+        api_rows = self.client.probe_row_count(date_str) if self.client else None
+        source = 'probe'
+        if api_rows is None:
+            api_rows = int(round(ratios['api_rows_per_date']))
+            source = 'history'
+
+        rows = api_rows * self.devices
+        requests = requests_for_rows(api_rows)
+        return DatePlan(
+            date=date_str,
+            urls=int(round(api_rows * ratios['urls_per_api_row'])),
+            source=source,
+            requests=requests,
+            rows=rows,
+            bytes=int(rows * ratios['bytes_per_row']),
+            seconds=requests * ratios['seconds_per_request'],
+        )
+
+    def plan_period(self, start_date: str, end_date: str) -> List[DatePlan]:
+        ratios = self.load_ratios()
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+
+        plans = []
+        current = start
+        while current <= end:
+            plans.append(self.plan_date(current.strftime('%Y-%m-%d'), ratios))
+            current += timedelta(days=1)
+        return plans
+
+    def split_into_chunks(self, plans: List[DatePlan]) -> List[List[DatePlan]]:
+        """Greedy split of consecutive dates into runs that fit the daily quota.
+
+        Дата, которая одна превышает квоту, получает отдельный прогон.
+        """
+        chunks: List[List[DatePlan]] = []
+        current: List[DatePlan] = []
+        used = 0
+        for plan in plans:
+            if current and used + plan.requests > self.daily_quota:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(plan)
+            used += plan.requests
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def print_plan(self, plans: List[DatePlan]):
+        print(f"{'date':<12}{'urls':>8} {'src':<8}{'requests':>10}{'rows':>12}{'MiB':>9}{'minutes':>9}")
+        for p in plans:
+            print(f"{p.date:<12}{p.urls:>8} {p.source:<8}{p.requests:>10}{p.rows:>12}"
+                  f"{p.bytes / 2 ** 20:>9.1f}{p.seconds / 60:>9.1f}")
+
+        print("-" * 68)
+        print(f"{'total':<12}{sum(p.urls for p in plans):>8} {'':<8}"
+              f"{sum(p.requests for p in plans):>10}{sum(p.rows for p in plans):>12}"
+              f"{sum(p.bytes for p in plans) / 2 ** 20:>9.1f}{sum(p.seconds for p in plans) / 60:>9.1f}")
+
+        chunks = self.split_into_chunks(plans)
+        print(f"\nDaily quota {self.daily_quota} requests -> {len(chunks)} run(s):")
+        for day, chunk in enumerate(chunks, 1):
+            requests = sum(p.requests for p in chunk)
+            marker = "  ! exceeds quota" if requests > self.daily_quota else ""
+            print(f"  day {day}: {chunk[0].date} .. {chunk[-1].date} "
+                  f"({len(chunk)} dates, {requests} requests){marker}")
+            print(f"         python run.py {chunk[0].date} {chunk[-1].date}")
@@ -0,0 +1,125 @@
+"""AdaptiveConcurrencyLimiter AIMD transitions."""
+import threading
+import time
+
+from api.concurrency import AdaptiveConcurrencyLimiter
+
+
+class Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+def saturate(limiter: AdaptiveConcurrencyLimiter):
+    """Occupy every slot of the current limit, then free them."""
+    slots = int(limiter.limit)
+    for _ in range(slots):
+        limiter.acquire()
+    for _ in range(slots):
+        limiter.release()
+
+
+def healthy_window(limiter: AdaptiveConcurrencyLimiter, latency: float = 0.1):
+    saturate(limiter)
+    for _ in range(limiter.window):
+        limiter.record(latency, 200, time.monotonic())
+
+
+def test_saturated_healthy_window_increases_by_one():
+    limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=10, window=5)
+    healthy_window(limiter)
+    assert limiter.limit == 5
+    assert limiter.baseline == 0.1
+
+
+def test_unsaturated_window_does_not_increase():
+    limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=10, window=5)
+    for _ in range(3):
+        limiter.call(lambda: Response(200))
+    for _ in range(5):
+        limiter.record(0.1, 200, time.monotonic())
+    assert limiter.limit == 4
+
+
+def test_increase_stops_at_max_limit():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=3, window=3)
+    for _ in range(5):
+        healthy_window(limiter)
+    assert limiter.limit == 3
+
+
+def test_throttled_response_halves_limit():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, max_limit=10, window=5)
+    limiter.record(0.1, 429, time.monotonic())
+    assert limiter.limit == 4
+    limiter.record(0.1, 503, time.monotonic())
+    assert limiter.limit == 2
+    limiter.record(0.1, None, time.monotonic())
+    assert limiter.limit == 1
+    limiter.record(0.1, 429, time.monotonic())
+    assert limiter.limit == 1  # не ниже min_limit
+
+
+def test_stale_responses_are_ignored_after_decrease():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, max_limit=10, window=3)
+    started = time.monotonic()
+    time.sleep(0.001)
+    limiter.record(0.1, 429, time.monotonic())
+    assert limiter.limit == 4
+
+    # Ответы на запросы, начатые до снижения, не снижают повторно и не идут в окно
+    for _ in range(5):
+        limiter.record(0.1, 429, started)
+        limiter.record(5.0, 200, started)
+    assert limiter.limit == 4
+    assert limiter.baseline is None
+
+
+def test_throttled_samples_do_not_enter_latency_window():
+    limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=10, window=3)
+    limiter.record(30.0, None, time.monotonic())
+    healthy_window(limiter, latency=0.2)
+    assert limiter.baseline == 0.2
+
+
+def test_latency_growth_cuts_limit_by_quarter():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, max_limit=10, window=5, latency_factor=2.0)
+    healthy_window(limiter, latency=0.1)
+    assert limiter.limit == 9
+
+    healthy_window(limiter, latency=0.5)
+    assert limiter.limit == 9 * 0.75
+    assert limiter.baseline == 0.1
+
+
+def test_concurrent_calls_grow_limit_and_stay_within_it():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=6, window=5, latency_factor=100)
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+    over_limit = []
+
+    def request():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+            if active > int(limiter.limit):
+                over_limit.append(active)
+        time.sleep(0.005)
+        with lock:
+            active -= 1
+        return Response(200)
+
+    threads = [
+        threading.Thread(target=lambda: [limiter.call(request) for _ in range(40)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.limit == 6
+    assert peak > 2
+    assert not over_limit
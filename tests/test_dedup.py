@@ -0,0 +1,83 @@
+"""RecordDeduplicator: exact-URL attribution and in-run duplicates."""
+from datetime import date
+
+import pytest
+
+from core.dedup import RecordDeduplicator, containment_levels
+from models.records import WebmasterRecord
+
+DAY = date(2025, 3, 1)
+
+
+def record(page_path: str, impressions: int, clicks: int, position: float,
+           query: str = 'фильтр', device: str = 'DESKTOP') -> WebmasterRecord:
+    return WebmasterRecord(DAY, page_path, query, 0, impressions, clicks, position, device)
+
+
+def test_order_urls_longest_first():
+    dedup = RecordDeduplicator()
+    assert dedup.order_urls(['/a', '/a/b/c', '/a/b']) == ['/a/b/c', '/a/b', '/a']
+    assert RecordDeduplicator(exact_url_match=False).order_urls(['/a', '/a/b']) == ['/a', '/a/b']
+
+
+def test_shorter_url_keeps_own_metrics():
+    dedup = RecordDeduplicator()
+    assert dedup.filter('/catalog/filters', [record('/catalog/filters', 1, 0, 3.0)])
+
+    # Строка /catalog включает метрики /catalog/filters
+    kept = dedup.filter('/catalog', [record('/catalog', 6, 2, 5.0)])
+    assert len(kept) == 1
+    own = kept[0]
+    assert (own.impressions, own.clicks) == (5, 2)
+    assert own.position == pytest.approx((5.0 * 6 - 3.0 * 1) / 5)
+    assert dedup.stats['overlap_adjusted'] == 1
+
+
+def test_fully_covered_row_is_dropped():
+    dedup = RecordDeduplicator()
+    dedup.filter('/catalog/filters', [record('/catalog/filters', 4, 1, 2.0)])
+    assert dedup.filter('/catalog', [record('/catalog', 4, 1, 2.0)]) == []
+    assert dedup.stats['overlap_dropped'] == 1
+    assert dedup.stats['bytes_saved'] > 0
+
+
+def test_other_query_or_device_is_not_adjusted():
+    dedup = RecordDeduplicator()
+    dedup.filter('/catalog/filters', [record('/catalog/filters', 4, 1, 2.0)])
+    kept = dedup.filter('/catalog', [
+        record('/catalog', 4, 1, 2.0, query='другой'),
+        record('/catalog', 4, 1, 2.0, device='MOBILE'),
+    ])
+    assert [r.impressions for r in kept] == [4, 4]
+
+
+def test_claims_from_other_workers_are_subtracted():
+    dedup = RecordDeduplicator()
+    dedup.add_claims([record('/catalog/filters', 2, 1, 1.0)])
+    kept = dedup.filter('/catalog', [record('/catalog', 5, 1, 4.0)])
+    assert (kept[0].impressions, kept[0].clicks) == (3, 0)
+
+
+def test_in_run_duplicates_are_dropped():
+    dedup = RecordDeduplicator(exact_url_match=False)
+    row = record('/catalog', 3, 1, 2.0)
+    assert dedup.filter('/catalog', [row, row]) == [row]
+    assert (dedup.stats['rows_in'], dedup.stats['rows_out']) == (2, 1)
+    assert dedup.stats['duplicate_dropped'] == 1
+
+
+def test_containment_levels():
+    levels = containment_levels(['/catalog', '/catalog/filters', '/catalog/filters/x', '/b/catalog', '/a', '/c'])
+    assert levels == {
+        '/catalog/filters/x': 0, '/b/catalog': 0, '/a': 0,
+        '/catalog/filters': 1,
+        '/catalog': 2,   # ниже всех содержащих его URL
+        '/c': 3,         # входит в /catalog
+    }
+
+
+def test_url_tiers_never_mix_contained_urls():
+    urls = ['/catalog', '/catalog/filters', '/about', '/catalog/filters/x']
+    tiers = RecordDeduplicator().url_tiers(urls)
+    assert tiers == [['/catalog/filters/x', '/about'], ['/catalog/filters'], ['/catalog']]
+    assert RecordDeduplicator(exact_url_match=False).url_tiers(urls) == [urls]
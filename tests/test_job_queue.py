@@ -0,0 +1,82 @@
+"""JobWorker: a blocked queue is waited on, an empty one ends the run; tasks run concurrently."""
+import threading
+import time
+from datetime import date
+
+from api.concurrency import AdaptiveConcurrencyLimiter
+
+from services import job_queue
+from services.job_queue import FetchJob, JobWorker
+
+
+class FakeQueue:
+    """claim() results in order; is_blocked() answers for each empty claim."""
+
+    def __init__(self, claims, blocked):
+        self.claims = list(claims)
+        self.blocked = list(blocked)
+        self.completed = []
+        self.lock = threading.Lock()
+
+    def claim(self, worker_id, limit=1):
+        with self.lock:
+            return self.claims.pop(0) if self.claims else []
+
+    def is_blocked(self):
+        with self.lock:
+            return self.blocked.pop(0) if self.blocked else False
+
+    def complete(self, job, worker_id, rows):
+        with self.lock:
+            self.completed.append(job.id)
+
+    def fail(self, job, worker_id, error):
+        raise AssertionError(error)
+
+
+def make_worker(queue, threads=1):
+    worker = JobWorker(loader=None, queue=queue, worker_id='test', threads=threads)
+    worker.process = lambda job: 1
+    return worker
+
+
+def test_worker_waits_while_tasks_are_blocked(monkeypatch):
+    monkeypatch.setattr(job_queue, 'BLOCKED_POLL_SECONDS', 0)
+    job = FetchJob(1, date(2025, 3, 1), '/catalog', 'DESKTOP')
+    # Пусто, но задачи ждут яруса другого воркера -> ждем; затем задача; затем очередь пуста
+    queue = FakeQueue(claims=[[], [], [job]], blocked=[True, True, False])
+    assert make_worker(queue).run() == 1
+    assert queue.completed == [1]
+
+
+def test_worker_exits_on_empty_queue():
+    queue = FakeQueue(claims=[], blocked=[False])
+    assert make_worker(queue).run() == 0
+
+
+def test_worker_threads_run_api_calls_concurrently():
+    limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=4, window=5)
+    jobs = [[FetchJob(i, date(2025, 3, 1), f'/page/{i}', 'DESKTOP')] for i in range(40)]
+    queue = FakeQueue(claims=jobs, blocked=[])
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    class Response:
+        status_code = 200
+
+    def request():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.005)
+        with lock:
+            active -= 1
+        return Response()
+
+    worker = make_worker(queue, threads=8)
+    worker.process = lambda job: limiter.call(request) and 1
+    assert worker.run() == 40
+    assert sorted(queue.completed) == list(range(40))
+    assert 1 < peak <= 4
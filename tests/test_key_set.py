@@ -0,0 +1,60 @@
+"""BloomFilter and Bloom-positive verification of ExistingKeySet."""
+from contextlib import contextmanager
+from datetime import date
+
+from models.records import WebmasterRecord
+from services import key_set
+from services.key_set import BloomFilter, ExistingKeySet
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(capacity=5000)
+    keys = [(f'/page/{i}', f'query {i}', 'MOBILE') for i in range(5000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_false_positive_rate_near_error_rate():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add((f'/page/{i}', f'query {i}', 'DESKTOP'))
+
+    probes = 20000
+    false_positives = sum(
+        (f'/other/{i}', f'query {i}', 'DESKTOP') in bloom for i in range(probes)
+    )
+    assert false_positives / probes < 0.02
+
+
+def test_empty_filter_contains_nothing():
+    bloom = BloomFilter(capacity=0)
+    assert ('/', 'query', 'TABLET') not in bloom
+
+
+def test_verify_queries_in_bounded_chunks(monkeypatch):
+    chunk_sizes = []
+
+    class FakeDb:
+        def execute(self, statement):
+            keys = next(v for v in statement.compile().params.values() if isinstance(v, list))
+            chunk_sizes.append(len(keys))
+            # Первый ключ каждой порции "уже есть" в БД
+            return [keys[0]]
+
+    @contextmanager
+    def fake_get_db():
+        yield FakeDb()
+
+    monkeypatch.setattr(key_set, 'get_db', fake_get_db)
+    monkeypatch.setattr(key_set, 'VERIFY_CHUNK_SIZE', 100)
+
+    day = date(2025, 3, 1)
+    candidates = [
+        WebmasterRecord(day, f'/page/{i}', f'query {i}', 1, 1, 0, 1.0, 'desktop')
+        for i in range(250)
+    ]
+    existing = ExistingKeySet(day)._verify(candidates)
+    assert chunk_sizes == [100, 100, 50]
+    assert existing == {('/page/0', 'query 0', 'desktop'), ('/page/100', 'query 100', 'desktop'),
+                        ('/page/200', 'query 200', 'desktop')}
@@ -0,0 +1,134 @@
+"""FetchWritePipeline: error propagation and backpressure."""
+import threading
+import time
+
+import pytest
+
+from models.records import WebmasterRecord
+from services.pipeline import FetchWritePipeline
+
+
+def make_record(i: int) -> WebmasterRecord:
+    return WebmasterRecord(
+        date=None, page_path=f'/page/{i}', query=f'q{i}', demand=0,
+        impressions=1, clicks=0, position=1.0, device='DESKTOP',
+    )
+
+
+def tasks(count: int):
+    return [(f'/page/{i}', 'DESKTOP') for i in range(count)]
+
+
+def test_writes_all_fetched_records_in_batches():
+    batches = []
+
+    def write(batch):
+        batches.append(len(batch))
+        return len(batch)
+
+    pipeline = FetchWritePipeline(
+        fetch=lambda url, device: [make_record(int(url.rsplit('/', 1)[1]))],
+        write=write, fetch_workers=3, queue_size=4, batch_size=10,
+    )
+    assert pipeline.run(tasks(25)) == 25
+    assert sum(batches) == 25
+    assert all(size >= 10 for size in batches[:-1])
+
+
+def test_transform_is_applied_before_write():
+    written = []
+    pipeline = FetchWritePipeline(
+        fetch=lambda url, device: [make_record(int(url.rsplit('/', 1)[1]))],
+        write=lambda batch: written.extend(batch) or len(batch),
+        transform=lambda records: [r for r in records if r.page_path != '/page/3'],
+        fetch_workers=2, queue_size=2, batch_size=100,
+    )
+    assert pipeline.run(tasks(5)) == 4
+    assert '/page/3' not in {r.page_path for r in written}
+
+
+def test_fetch_error_is_raised_from_run():
+    def fetch(url, device):
+        if url == '/page/7':
+            raise RuntimeError('api down')
+        return [make_record(0)]
+
+    pipeline = FetchWritePipeline(
+        fetch=fetch, write=len, fetch_workers=4, queue_size=2, batch_size=5,
+    )
+    with pytest.raises(RuntimeError, match='api down'):
+        pipeline.run(tasks(50))
+
+
+def test_write_error_stops_fetch_workers():
+    fetched = []
+
+    def fetch(url, device):
+        fetched.append(url)
+        return [make_record(0)]
+
+    def write(batch):
+        raise ValueError('db down')
+
+    pipeline = FetchWritePipeline(
+        fetch=fetch, write=write, fetch_workers=2, queue_size=2, batch_size=1,
+    )
+    started = time.monotonic()
+    with pytest.raises(ValueError, match='db down'):
+        pipeline.run(tasks(1000))
+    # Воркеры остановились, а не скачали все задачи
+    assert len(fetched) < 1000
+    assert time.monotonic() - started < 10
+    assert not [t for t in threading.enumerate() if t.name.startswith('fetch-')]
+
+
+def test_slow_writer_bounds_queued_results():
+    queue_size = 3
+    fetched = 0
+    written = 0
+    max_ahead = 0
+    lock = threading.Lock()
+
+    def fetch(url, device):
+        nonlocal fetched, max_ahead
+        with lock:
+            fetched += 1
+            max_ahead = max(max_ahead, fetched - written)
+        return [make_record(0)]
+
+    def write(batch):
+        nonlocal written
+        time.sleep(0.01)
+        with lock:
+            written += len(batch)
+        return len(batch)
+
+    pipeline = FetchWritePipeline(
+        fetch=fetch, write=write, fetch_workers=2, queue_size=queue_size, batch_size=1,
+    )
+    assert pipeline.run(tasks(40)) == 40
+    # В очереди не больше queue_size результатов, плюс по одному в руках
+    # у каждого воркера и у писателя
+    assert max_ahead <= queue_size + 2 + 1
+
+
+def test_paged_fetch_streams_each_page_to_writer():
+    pages_fetched = []
+    pages_at_write = []
+
+    def fetch_pages(day):
+        for page in range(4):
+            pages_fetched.append(page)
+            time.sleep(0.01)
+            yield [make_record(page * 10 + i) for i in range(10)]
+
+    def write(batch):
+        pages_at_write.append(len(pages_fetched))
+        return len(batch)
+
+    pipeline = FetchWritePipeline(
+        fetch=fetch_pages, write=write, fetch_workers=1, queue_size=2, batch_size=10,
+    )
+    assert pipeline.run([('2025-03-01',)]) == 40
+    # Первая страница записана до того, как скачана последняя
+    assert pages_at_write[0] < 4
@@ -0,0 +1,55 @@
+"""BackfillPlanner: request estimates and quota chunking."""
+from services.planner import DEFAULT_RATIOS, BackfillPlanner, DatePlan, requests_for_rows
+
+
+def plan(day: int, requests: int) -> DatePlan:
+    return DatePlan(f'2025-01-{day:02d}', 0, 'history', requests, 0, 0, 0.0)
+
+
+def test_requests_for_rows_counts_pages():
+    assert requests_for_rows(0) == 1
+    assert requests_for_rows(499) == 1
+    assert requests_for_rows(500) == 2  # последняя страница пустая
+    assert requests_for_rows(1200) == 3
+
+
+def test_failed_probe_falls_back_to_history():
+    class FailingClient:
+        def probe_row_count(self, target_date):
+            return None
+
+    ratios = dict(DEFAULT_RATIOS, api_rows_per_date=1000.0)
+    plan = BackfillPlanner(FailingClient(), daily_quota=100).plan_date('2025-01-01', ratios)
+    assert plan.source == 'history'
+    assert plan.requests == 3
+    assert plan.rows == 3000
+
+
+def test_split_into_chunks_respects_quota():
+    planner = BackfillPlanner(daily_quota=100)
+    chunks = planner.split_into_chunks([plan(1, 40), plan(2, 40), plan(3, 40), plan(4, 60)])
+    assert [[p.date[-2:] for p in chunk] for chunk in chunks] == [['01', '02'], ['03', '04']]
+
+
+def test_split_into_chunks_oversized_date_gets_own_run():
+    planner = BackfillPlanner(daily_quota=100)
+    chunks = planner.split_into_chunks([plan(1, 30), plan(2, 250), plan(3, 30)])
+    assert [len(chunk) for chunk in chunks] == [1, 1, 1]
+
+
+def test_split_into_chunks_empty():
+    assert BackfillPlanner(daily_quota=100).split_into_chunks([]) == []
+
+
+def test_probe_row_count_returns_none_on_connection_error():
+    from api.concurrency import AdaptiveConcurrencyLimiter
+    from api.webmaster_client import WebmasterClient
+
+    class BrokenSession:
+        def get(self, *args, **kwargs):
+            raise ConnectionError('connection reset')
+
+    client = WebmasterClient()
+    client.session = BrokenSession()
+    client.limiter = AdaptiveConcurrencyLimiter()  # не трогаем общий лимитер
+    assert client.probe_row_count('2025-01-01') is None
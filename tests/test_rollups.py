@@ -0,0 +1,32 @@
+"""Period arithmetic of the weekly/monthly rollups."""
+from datetime import date
+
+from etl.rollups import covering_grain, period_end, period_start, periods_between
+
+
+def test_period_bounds():
+    assert period_start(date(2025, 3, 13), 'week') == date(2025, 3, 10)
+    assert period_end(date(2025, 3, 10), 'week') == date(2025, 3, 16)
+    assert period_start(date(2025, 2, 14), 'month') == date(2025, 2, 1)
+    assert period_end(date(2024, 2, 1), 'month') == date(2024, 2, 29)
+    assert period_end(date(2024, 12, 1), 'month') == date(2024, 12, 31)
+
+
+def test_covering_grain_prefers_month():
+    assert covering_grain(date(2025, 1, 1), date(2025, 3, 31)) == 'month'
+    # 2024-07-01 - понедельник, 2024-09-29 - воскресенье: целые недели, но не месяцы
+    assert covering_grain(date(2024, 7, 1), date(2024, 9, 29)) == 'week'
+
+
+def test_covering_grain_none_for_partial_periods():
+    assert covering_grain(date(2025, 3, 11), date(2025, 3, 16)) is None
+    assert covering_grain(date(2025, 3, 10), date(2025, 3, 15)) is None
+
+
+def test_periods_between_includes_partial_edges():
+    assert periods_between(date(2025, 1, 15), date(2025, 3, 2), 'month') == [
+        date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1),
+    ]
+    assert periods_between(date(2025, 3, 12), date(2025, 3, 18), 'week') == [
+        date(2025, 3, 10), date(2025, 3, 17),
+    ]
@@ -0,0 +1,58 @@
+"""WebmasterClient: search-queries paging and the per-date page index."""
+import json
+
+from api.webmaster_client import PAGE_SIZE, WebmasterClient
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self._payload = payload
+        self.content = json.dumps(payload).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    """search-queries over `rows` rows spread across `urls` pages."""
+
+    def __init__(self, rows: int, urls: int):
+        self.rows = [
+            {'page_url': f'/page/{i % urls}', 'query_text': f'q{i}',
+             'impressions': 2, 'clicks': 1, 'position': 3.0}
+            for i in range(rows)
+        ]
+        self.calls = 0
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        self.calls += 1
+        offset, limit = params['offset'], params['limit']
+        return FakeResponse({'queries': self.rows[offset:offset + limit]})
+
+
+def make_client(rows: int, urls: int):
+    client = WebmasterClient()
+    client.session = FakeSession(rows, urls)
+    return client
+
+
+def test_page_index_covers_every_page():
+    client = make_client(rows=3 * PAGE_SIZE, urls=700)
+    urls = client.get_urls_for_date('2025-03-01')
+    assert len(urls) == 700
+    pages = client.session.calls
+
+    fetched = sum(
+        len(client.get_queries_for_url_and_date('2025-03-01', url, 'DESKTOP')) for url in urls
+    )
+    assert fetched == 3 * PAGE_SIZE
+    # Индекс строится из страниц, уже скачанных get_urls_for_date
+    assert client.session.calls == pages
+
+
+def test_iter_query_pages_stops_on_short_page():
+    client = make_client(rows=PAGE_SIZE + 1, urls=10)
+    assert [len(page) for page in client.iter_query_pages('2025-03-01')] == [PAGE_SIZE, 1]
+    assert client.session.calls == 2
@@ -0,0 +1,121 @@
+"""WebmasterDataLoader.load_date: parallel fetch through the pipeline, tiered attribution."""
+import json
+import threading
+import time
+
+import pytest
+
+from api.concurrency import AdaptiveConcurrencyLimiter
+from config.settings import Settings
+from core.webmaster_loader import WebmasterDataLoader
+
+DAY = '2025-03-01'
+
+# Собственные метрики URL: impressions, clicks, position
+OWN = {
+    '/catalog/filters': (2, 1, 2.0),
+    '/about': (3, 0, 6.0),
+    '/catalog': (5, 1, 4.0),
+}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+        self.content = json.dumps(payload).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    def json(self):
+        return self._payload
+
+
+def statistics(impressions, clicks, position):
+    return [
+        {'date': DAY, 'field': field, 'value': value}
+        for field, value in (('DEMAND', impressions), ('IMPRESSIONS', impressions),
+                             ('CLICKS', clicks), ('POSITION', position))
+    ]
+
+
+class FakeSession:
+    """query-analytics/list: TEXT_MATCH returns the URL plus every longer URL containing it."""
+
+    def __init__(self, delay: float = 0.0, urls=OWN):
+        self.delay = delay
+        self.urls = list(urls)
+        self.posts = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        with self.lock:
+            self.posts += 1
+        if json['text_indicator'] == 'URL':
+            return FakeResponse({'text_indicator_to_statistics': [
+                {'text_indicator': {'value': page_url}} for page_url in self.urls
+            ]})
+
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        page_url = json['filters']['text_filters'][0]['value']
+        matched = [OWN.get(u, (1, 0, 1.0)) for u in self.urls if page_url in u]
+        impressions = sum(m[0] for m in matched)
+        clicks = sum(m[1] for m in matched)
+        position = sum(m[0] * m[2] for m in matched) / impressions
+        return FakeResponse({'text_indicator_to_statistics': [{
+            'text_indicator': {'value': 'фильтр'},
+            'statistics': statistics(impressions, clicks, position),
+        }]})
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    monkeypatch.setattr(Settings, 'PRELOAD_KEYS', False)
+    monkeypatch.setattr(Settings, 'URL_EXACT_MATCH', True)
+    loader = WebmasterDataLoader()
+    loader.session = FakeSession()
+    loader.written = []
+    loader.save_to_database = lambda records: loader.written.extend(records) or len(records)
+    return loader
+
+
+def test_load_date_writes_own_metrics_per_url(loader):
+    assert loader.load_date(DAY) == 9
+    # 1 запрос списка URL + URL × 3 устройства
+    assert loader.session.posts == 1 + 3 * 3
+
+    desktop = {r.page_path: r for r in loader.written if r.device == 'desktop'}
+    for page_url, (impressions, clicks, position) in OWN.items():
+        assert (desktop[page_url].impressions, desktop[page_url].clicks) == (impressions, clicks)
+        assert desktop[page_url].position == pytest.approx(position)
+
+
+def test_load_date_writes_before_all_fetches_finish(loader, monkeypatch):
+    monkeypatch.setattr(Settings, 'BATCH_SIZE', 1)
+    loader.session.delay = 0.02
+    posts_at_first_write = []
+
+    def save(records):
+        posts_at_first_write.append(loader.session.posts)
+        loader.written.extend(records)
+        return len(records)
+
+    loader.save_to_database = save
+    assert loader.load_date(DAY) == 9
+    assert posts_at_first_write[0] < loader.session.posts
+
+
+def test_load_date_runs_requests_concurrently_under_limiter(loader):
+    # 200 независимых URL: один ярус, запросы идут параллельно, лимит растет
+    loader.session = FakeSession(delay=0.002, urls=[f'/page/{i}/' for i in range(200)])
+    loader.limiter = AdaptiveConcurrencyLimiter(initial=2, max_limit=8, window=10, latency_factor=100)
+    assert loader.load_date(DAY) == 600
+    assert loader.session.peak > 2
+    assert loader.limiter.limit > 2
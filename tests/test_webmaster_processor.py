@@ -0,0 +1,13 @@
+"""ETL anti-join against ppl must see archived rows too."""
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from etl.webmaster_processor import WebmasterETLProcessor
+from models.database import WebmasterData
+
+
+def test_not_in_ppl_checks_hot_and_cold_rows():
+    statement = select(WebmasterData.date).where(WebmasterETLProcessor()._not_in_ppl())
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert 'NOT (EXISTS' in sql
+    assert 'ppl.webmaster_aggregated_all' in sql